@@ -1,21 +1,42 @@
 # In: app/ai_providers.py
 
+import asyncio
+import hashlib
+import re
+import time
 import google.generativeai as genai
 from zai import ZaiClient 
-from typing import Protocol, Dict, Any
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Protocol, Dict, Any, List, Optional, Tuple
 
 class AIProvider(Protocol):
 
     async def ask(self, api_key: str, system_prompt: str, business_data_json: str, user_question: str ) -> str:
         ...
 
+
+@lru_cache(maxsize=32)
+def _get_gemini_model(api_key: str) -> genai.GenerativeModel:
+    # genai.configure() is process-global, but a model binds its API client (and
+    # therefore the key) on its first request. Callers use the returned model
+    # straight away, so each cached model keeps the key it was created with.
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel('gemini-2.5-flash')
+
+
+@lru_cache(maxsize=32)
+def _get_zai_client(api_key: str) -> ZaiClient:
+    # One client per key so its HTTP connection pool is reused across requests.
+    return ZaiClient(api_key=api_key)
+
+
 class GeminiProvider:
     async def ask(self, api_key: str, system_prompt: str, business_data_json: str, user_question: str) -> str:
         try:
-            genai.configure(api_key=api_key)
-            model = genai.GenerativeModel('gemini-2.5-flash')
+            model = _get_gemini_model(api_key)
             full_prompt = f"{system_prompt}\n\n{business_data_json}\n\nUser Question: {user_question}"
-            response = model.generate_content(full_prompt)
+            response = await model.generate_content_async(full_prompt)
             return response.text
         except Exception as e:
             print(f"Gemini API Error: {e}")
@@ -25,7 +46,7 @@ class ZaiProvider:
     async def ask(self, api_key: str, system_prompt: str, business_data_json: str, user_question: str) -> str:
         try:
 
-            client = ZaiClient(api_key=api_key)
+            client = _get_zai_client(api_key)
 
             messages = [
 
@@ -34,7 +55,10 @@ class ZaiProvider:
                 {"role": "user", "content": user_question}
             ]
 
-            response = client.chat.completions.create(
+            # The Z.ai SDK is synchronous; run it in a worker thread so a slow
+            # completion doesn't block the event loop for every other request.
+            response = await asyncio.to_thread(
+                client.chat.completions.create,
                 model="glm-4.5-flash",  
                 messages=messages,
                 temperature=0.5, 
@@ -51,9 +75,49 @@ class ZaiProvider:
             print(f"Z.ai API Error: {e}")
             raise ConnectionError("Failed to get a response from the Z.ai API. Please check your API key and model configuration.")
 
+class CachingProvider:
+    """
+    Wraps a provider and answers repeats of an identical (system prompt, business
+    data, question) triple from memory instead of calling the LLM again.
+    Entries are kept per process, expire after `ttl` seconds and the least recently
+    used ones are dropped beyond `maxsize`. Failed calls are not cached.
+    """
+    def __init__(self, inner: AIProvider, maxsize: int = 256, ttl: float = 3600):
+        self.inner = inner
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[bytes, Tuple[float, str]]" = OrderedDict()
+
+    def _get(self, key: bytes) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, answer = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return answer
+
+    def _set(self, key: bytes, answer: str) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl, answer)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    async def ask(self, api_key: str, system_prompt: str, business_data_json: str, user_question: str) -> str:
+        key = hashlib.sha256(
+            "\x00".join((system_prompt, business_data_json, user_question)).encode("utf-8")
+        ).digest()
+        answer = self._get(key)
+        if answer is None:
+            answer = await self.inner.ask(api_key, system_prompt, business_data_json, user_question)
+            self._set(key, answer)
+        return answer
+
 AI_PROVIDERS: Dict[str, AIProvider] = {
-    "gemini": GeminiProvider(),
-    "zai": ZaiProvider()
+    "gemini": CachingProvider(GeminiProvider()),
+    "zai": CachingProvider(ZaiProvider())
 }
 
 def get_ai_provider(provider_name: str) -> AIProvider:
@@ -61,3 +125,59 @@ def get_ai_provider(provider_name: str) -> AIProvider:
     if not provider:
         raise ValueError(f"Unknown AI provider: {provider_name}")
     return provider
+
+
+async def ask_many(provider: AIProvider, api_key: str, system_prompt: str, business_data_json: str, questions: List[str], concurrency: int = 8) -> List[str]:
+    """
+    Asks several questions about the same business data concurrently instead of
+    one after another. At most `concurrency` requests are in flight at once to
+    stay within provider rate limits. Answers come back in question order.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def ask_one(question: str) -> str:
+        async with semaphore:
+            return await provider.ask(api_key, system_prompt, business_data_json, question)
+
+    return await asyncio.gather(*(ask_one(q) for q in questions))
+
+
+_ANSWER_TAG = re.compile(r"\[A(\d+)\]")
+
+
+def _split_answers(response: str, count: int) -> Optional[List[str]]:
+    """
+    Splits a "[A1] ... [A2] ..." response into its answers. Returns None unless
+    exactly answers 1..count are present.
+    """
+    parts = _ANSWER_TAG.split(response)
+    answers = {int(number): text.strip() for number, text in zip(parts[1::2], parts[2::2])}
+    if sorted(answers) != list(range(1, count + 1)):
+        return None
+    return [answers[n] for n in range(1, count + 1)]
+
+
+async def ask_batch(provider: AIProvider, api_key: str, system_prompt: str, business_data_json: str, questions: List[str], batch_size: int = 8) -> List[str]:
+    """
+    Asks several questions about the same business data using one request per
+    `batch_size` questions, so the (large) business data is only sent once per batch.
+    If a response can't be split back into one answer per question, that batch
+    falls back to individual requests via ask_many. Answers come back in question order.
+    """
+    batch_prompt = (
+        f"{system_prompt}\n\n"
+        "You will be given several numbered questions ([Q1], [Q2], ...). Answer each one "
+        "separately, starting every answer with its matching tag ([A1], [A2], ...)."
+    )
+
+    async def ask_chunk(chunk: List[str]) -> List[str]:
+        joined = "\n".join(f"[Q{n}] {question}" for n, question in enumerate(chunk, start=1))
+        response = await provider.ask(api_key, batch_prompt, business_data_json, joined)
+        answers = _split_answers(response, len(chunk))
+        if answers is None:
+            answers = await ask_many(provider, api_key, system_prompt, business_data_json, chunk)
+        return answers
+
+    chunks = [questions[i:i + batch_size] for i in range(0, len(questions), batch_size)]
+    results = await asyncio.gather(*(ask_chunk(chunk) for chunk in chunks))
+    return [answer for chunk_answers in results for answer in chunk_answers]
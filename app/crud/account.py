@@ -1,51 +1,66 @@
+from sqlalchemy import insert, select, delete, exists, and_
 from sqlalchemy.orm import Session
 from .. import models, schemas
+from .expenses import invalidate_expense_accounts
+
+# Standard Chart of Accounts every new business is seeded with.
+_DEFAULT_ACCOUNTS = (
+    # Assets
+    {"name": "Cash", "type": models.AccountType.ASSET, "is_system_account": True},
+    # {"name": "Bank", "type": models.AccountType.ASSET, "is_system_account": True},
+    {"name": "Accounts Receivable", "type": models.AccountType.ASSET, "is_system_account": True},
+    {"name": "Inventory", "type": models.AccountType.ASSET, "is_system_account": True},
+    {"name": "VAT Receivable (Input VAT)", "type": models.AccountType.ASSET, "is_system_account": True, "description": "Tracks VAT paid on purchases and expenses that can be reclaimed."},
+
+    # Liabilities
+    {"name": "Accounts Payable", "type": models.AccountType.LIABILITY, "is_system_account": True},
+    {"name": "Payroll Liabilities", "type": models.AccountType.LIABILITY, "is_system_account": True},
+    {"name": "PAYE Payable", "type": models.AccountType.LIABILITY, "is_system_account": True, "description": "Holds tax deducted from employees, awaiting remittance."},
+    {"name": "Pension Payable", "type": models.AccountType.LIABILITY, "is_system_account": True, "description": "Holds employee and employer pension contributions, awaiting remittance."},
+    {"name": "VAT Payable (Output VAT)", "type": models.AccountType.LIABILITY, "is_system_account": True, "description": "Tracks VAT collected from sales, owed to the government."},
+
+    # Equity
+    {"name": "Owner's Equity", "type": models.AccountType.EQUITY, "is_system_account": True},
+    # Revenue
+    {"name": "Sales Revenue", "type": models.AccountType.REVENUE, "is_system_account": True},
+    {"name": "Other Income", "type": models.AccountType.REVENUE, "is_system_account": True},
+    # Expenses
+    {"name": "Cost of Goods Sold", "type": models.AccountType.EXPENSE, "is_system_account": True},
+    {"name": "Salary Expense", "type": models.AccountType.EXPENSE, "is_system_account": True},
+    {"name": "Office Use Expense", "type": models.AccountType.EXPENSE, "is_system_account": False},
+    {"name": "Miscellaneous  Expense", "type": models.AccountType.EXPENSE, "is_system_account": False},
+)
+
 
 def create_default_chart_of_accounts(db: Session, business_id: int):
     """
     Seeds a new business with a standard Chart of Accounts.
     This should be called within the same transaction as business creation.
     """
-    default_accounts = [
-        # Assets
-        {"name": "Cash", "type": models.AccountType.ASSET, "is_system_account": True},
-        # {"name": "Bank", "type": models.AccountType.ASSET, "is_system_account": True},
-        {"name": "Accounts Receivable", "type": models.AccountType.ASSET, "is_system_account": True},
-        {"name": "Inventory", "type": models.AccountType.ASSET, "is_system_account": True},
-        {"name": "VAT Receivable (Input VAT)", "type": models.AccountType.ASSET, "is_system_account": True, "description": "Tracks VAT paid on purchases and expenses that can be reclaimed."},
-
-        # Liabilities
-        {"name": "Accounts Payable", "type": models.AccountType.LIABILITY, "is_system_account": True},
-        {"name": "Payroll Liabilities", "type": models.AccountType.LIABILITY, "is_system_account": True},
-        {"name": "PAYE Payable", "type": models.AccountType.LIABILITY, "is_system_account": True, "description": "Holds tax deducted from employees, awaiting remittance."},
-        {"name": "Pension Payable", "type": models.AccountType.LIABILITY, "is_system_account": True, "description": "Holds employee and employer pension contributions, awaiting remittance."},
-        {"name": "VAT Payable (Output VAT)", "type": models.AccountType.LIABILITY, "is_system_account": True, "description": "Tracks VAT collected from sales, owed to the government."},
-
-        # Equity
-        {"name": "Owner's Equity", "type": models.AccountType.EQUITY, "is_system_account": True},
-        # Revenue
-        {"name": "Sales Revenue", "type": models.AccountType.REVENUE, "is_system_account": True},
-        {"name": "Other Income", "type": models.AccountType.REVENUE, "is_system_account": True},
-        # Expenses
-        {"name": "Cost of Goods Sold", "type": models.AccountType.EXPENSE, "is_system_account": True},
-        {"name": "Salary Expense", "type": models.AccountType.EXPENSE, "is_system_account": True},
-        {"name": "Office Use Expense", "type": models.AccountType.EXPENSE, "is_system_account": False},
-        {"name": "Miscellaneous  Expense", "type": models.AccountType.EXPENSE, "is_system_account": False},
-    ]
 
-    for acc_data in default_accounts:
-        db_account = models.Account(**acc_data, business_id=business_id)
-        db.add(db_account)
+    # One executemany INSERT instead of building an ORM instance per account.
+    # render_nulls keeps every row the same shape so the batch isn't split.
+    rows = [
+        {"description": None, **acc_data, "business_id": business_id}
+        for acc_data in _DEFAULT_ACCOUNTS
+    ]
+    db.execute(insert(models.Account), rows, execution_options={"render_nulls": True})
 
 
 def get_chart_of_accounts(db: Session, business_id: int):
     """
     Retrieves all accounts for a specific business, ordered by type and name.
+    This is a read-only listing, so it returns lightweight rows
+    (id, name, type, is_system_account) rather than ORM objects.
     """
-    return db.query(models.Account)\
-        .filter(models.Account.business_id == business_id)\
-        .order_by(models.Account.type, models.Account.name)\
-        .all()
+    stmt = select(
+        models.Account.id,
+        models.Account.name,
+        models.Account.type,
+        models.Account.is_system_account
+    ).where(models.Account.business_id == business_id)\
+     .order_by(models.Account.type, models.Account.name)
+    return db.execute(stmt).all()
 
 
 
@@ -67,6 +82,7 @@ def create_account(db: Session, account: schemas.AccountCreate, business_id: int
     db.add(db_account)
     db.commit()
     db.refresh(db_account)
+    invalidate_expense_accounts(business_id)
     return db_account
 
 
@@ -79,6 +95,7 @@ def update_account(db: Session, account_id: int, account_update: schemas.Account
     db_account.name = account_update.name
     db.commit()
     db.refresh(db_account)
+    invalidate_expense_accounts(business_id)
     return db_account
 
 
@@ -87,20 +104,39 @@ def can_delete_account(db: Session, account_id: int) -> bool:
     Checks if an account has any associated ledger entries.
     Returns True if it's safe to delete, False otherwise.
     """
-    entry_count = db.query(models.LedgerEntry).filter(models.LedgerEntry.account_id == account_id).count()
-    return entry_count == 0
+    has_entries = db.query(
+        db.query(models.LedgerEntry).filter(models.LedgerEntry.account_id == account_id).exists()
+    ).scalar()
+    return not has_entries
 
 
 def delete_account(db: Session, account_id: int, business_id: int):
-    """Deletes a user-created account if it has no transactions."""
-    db_account = get_account_by_id(db, account_id=account_id, business_id=business_id)
-    if not db_account or db_account.is_system_account:
-        return False
-
-    if not can_delete_account(db, account_id=account_id):
-        return False 
+    """
+    Deletes a user-created account if it has no transactions, budget lines or
+    bank reconciliations.
+    The ownership, system-account and no-references checks are part of the
+    DELETE itself, so there is no separate lookup and no check-then-delete race.
+    """
+    is_deletable = and_(
+        models.Account.id == account_id,
+        models.Account.business_id == business_id,
+        models.Account.is_system_account == False,
+        ~exists().where(models.LedgerEntry.account_id == models.Account.id),
+        ~exists().where(models.BudgetLine.account_id == models.Account.id),
+        ~exists().where(models.BankReconciliation.account_id == models.Account.id)
+    )
 
-    db.delete(db_account)
+    # Bank account details hang off their chart-of-accounts entry (the ORM used
+    # to cascade this), so remove them under the same conditions first.
+    db.execute(
+        delete(models.BankAccount)
+        .where(models.BankAccount.chart_of_account_id.in_(select(models.Account.id).where(is_deletable)))
+        .execution_options(synchronize_session=False)
+    )
+    result = db.execute(
+        delete(models.Account).where(is_deletable).execution_options(synchronize_session=False)
+    )
     db.commit()
-    return True
+    invalidate_expense_accounts(business_id)
+    return result.rowcount == 1
 
@@ -3,12 +3,26 @@
 from sqlalchemy.orm import Session
 from sqlalchemy import func, case
 from sqlalchemy.sql.expression import extract
-from .. import models, crud
+from .. import models, schemas, crud
 from datetime import date, timedelta
+from itertools import groupby
+from operator import itemgetter
 from typing import List, Dict, Any
 from dateutil.relativedelta import relativedelta
 import numpy as np
-from sklearn.linear_model import LinearRegression
+
+
+# How each comparison metric is calculated from the Ledger. Every metric is a
+# weighted sum of each account's net credit (credit - debit); the weight depends
+# only on the account's name and type, so these are defined once at import time.
+_METRIC_WEIGHTS = {
+    "Total Sales": lambda name, type_: 1 if name == 'Sales Revenue' else 0,
+    "Gross Profit": lambda name, type_: 1 if type_ == models.AccountType.REVENUE or name == 'Cost of Goods Sold' else 0,
+    "Net Profit": lambda name, type_: 1 if type_ in (models.AccountType.REVENUE, models.AccountType.EXPENSE) else 0,
+    "Total Expenses": lambda name, type_: -1 if type_ == models.AccountType.EXPENSE else 0,
+}
+
+
 def get_comparison_data(
     db: Session,
     business_id: int,
@@ -23,42 +37,33 @@ def get_comparison_data(
     across a specified dimension.
     """
     
-    # 1. Define how to calculate each metric from the Ledger
-    metric_definitions = {
-        "Total Sales": func.sum(case(
-            (models.Account.name == 'Sales Revenue', models.LedgerEntry.credit - models.LedgerEntry.debit),
-            else_=0
-        )),
-        "Gross Profit": func.sum(case(
-            (models.Account.type == models.AccountType.REVENUE, models.LedgerEntry.credit - models.LedgerEntry.debit),
-            (models.Account.name == 'Cost of Goods Sold', -(models.LedgerEntry.debit - models.LedgerEntry.credit)),
-            else_=0
-        )),
-        "Net Profit": func.sum(case(
-            (models.Account.type == models.AccountType.REVENUE, models.LedgerEntry.credit - models.LedgerEntry.debit),
-            (models.Account.type == models.AccountType.EXPENSE, -(models.LedgerEntry.debit - models.LedgerEntry.credit)),
-            else_=0
-        )),
-        "Total Expenses": func.sum(case(
-            (models.Account.type == models.AccountType.EXPENSE, models.LedgerEntry.debit - models.LedgerEntry.credit),
-            else_=0
-        )),
-    }
-
-    # 2. Select the calculations requested by the user
-    selected_metrics = {key: metric_definitions[key].label(key) for key in metrics if key in metric_definitions}
+    # 1. Select the calculations requested by the user
+    selected_metrics = {key: _METRIC_WEIGHTS[key] for key in metrics if key in _METRIC_WEIGHTS}
     if not selected_metrics:
         return None
 
+    # 2. Resolve each account's weight per metric up front. With this small map
+    #    in memory the ledger query needs no join to Account.
+    accounts = db.query(models.Account.id, models.Account.name, models.Account.type)\
+        .filter(models.Account.business_id == business_id).all()
+    account_weights = {
+        acc.id: [weight(acc.name, acc.type) for weight in selected_metrics.values()]
+        for acc in accounts
+    }
+    if not account_weights:
+        return {"categories": [], "series": []}
+
     # 3. Define the dimension for grouping
-    query = db.query(*selected_metrics.values())
-    
     dimension_column = None
     if dimension == "month":
-        dimension_column = func.strftime('%Y-%m', models.LedgerEntry.transaction_date).label("dimension")
+        # Integer YYYYMM key: portable across SQLite/Postgres (unlike strftime) and
+        # sorts naturally; it is formatted back to "YYYY-MM" below.
+        dimension_column = (
+            extract('year', models.LedgerEntry.transaction_date) * 100
+            + extract('month', models.LedgerEntry.transaction_date)
+        ).label("dimension")
     elif dimension == "branch":
         dimension_column = models.Branch.name.label("dimension")
-        query = query.join(models.Branch, models.LedgerEntry.branch_id == models.Branch.id)
     elif dimension == "product_category":
         # This is more complex, requires joining through items and products
         # For now, we'll focus on the first two dimensions
@@ -67,92 +72,149 @@ def get_comparison_data(
     if dimension_column is None:
         raise ValueError("Unsupported dimension")
 
-    query = query.add_column(dimension_column)
+    query = db.query(
+        dimension_column,
+        models.LedgerEntry.account_id,
+        func.sum(models.LedgerEntry.credit - models.LedgerEntry.debit).label("net_credit")
+    )
+    if dimension == "branch":
+        query = query.join(models.Branch, models.LedgerEntry.branch_id == models.Branch.id)
 
     # 4. Apply standard filters
-    query = query.join(models.Account, models.LedgerEntry.account_id == models.Account.id)\
-                 .filter(models.Account.business_id == business_id)\
-                 .filter(models.LedgerEntry.transaction_date.between(start_date, end_date))
+    query = query.filter(
+        models.LedgerEntry.account_id.in_(account_weights),
+        models.LedgerEntry.transaction_date.between(start_date, end_date)
+    )
 
     # IMPORTANT: Apply branch permission filter if not a superuser
     if branch_id is not None:
         query = query.filter(models.LedgerEntry.branch_id == branch_id)
 
-    # 5. Group by the selected dimension and order it
-    query = query.group_by(dimension_column).order_by(dimension_column)
+    # 5. Group by the selected dimension (and account) and order it
+    query = query.group_by(dimension_column, models.LedgerEntry.account_id).order_by(dimension_column)
 
-    # 6. Execute the query
-    results = query.all()
+    # 6. Execute the query and fold the per-account rows into the metrics
+    totals_by_dimension = {}
+    for row in query.all():
+        totals = totals_by_dimension.setdefault(row.dimension, [0.0] * len(selected_metrics))
+        net_credit = row.net_credit or 0.0
+        for i, weight in enumerate(account_weights[row.account_id]):
+            if weight:
+                totals[i] += weight * net_credit
 
     # 7. Format the data for ECharts
-    if not results:
+    if not totals_by_dimension:
         return {"categories": [], "series": []}
 
-    categories = [row.dimension for row in results]
+    if dimension == "month":
+        categories = [f"{int(key) // 100:04d}-{int(key) % 100:02d}" for key in totals_by_dimension]
+    else:
+        categories = list(totals_by_dimension)
     series = []
-    for metric_name in selected_metrics.keys():
+    for i, metric_name in enumerate(selected_metrics.keys()):
         series.append({
             "name": metric_name,
             "type": 'bar', # Or 'line', can be configured later
-            "data": [getattr(row, metric_name) or 0 for row in results]
+            "data": [totals[i] for totals in totals_by_dimension.values()]
         })
 
     return {"categories": categories, "series": series}
 
 
+def _get_ledger_totals_by_period(db: Session, business_id: int, branch_id: int, cutoffs: List[date]):
+    """
+    Buckets every ledger entry up to the last cutoff into the period it falls in
+    ((previous cutoff, cutoff]), split by calendar year and account type, in one
+    grouped query. Callers roll the buckets up into YTD or running totals.
+    """
+    period = case(
+        *[(models.LedgerEntry.transaction_date <= cutoff, index) for index, cutoff in enumerate(cutoffs)]
+    ).label("period")
+    year = extract('year', models.LedgerEntry.transaction_date).label("year")
+    is_cogs = (models.Account.name == 'Cost of Goods Sold').label("is_cogs")
+
+    query = db.query(
+        period,
+        year,
+        models.Account.type,
+        is_cogs,
+        func.sum(models.LedgerEntry.debit - models.LedgerEntry.credit).label("net_debit")
+    ).join(models.Account, models.LedgerEntry.account_id == models.Account.id)\
+     .filter(
+        models.Account.business_id == business_id,
+        models.LedgerEntry.transaction_date <= cutoffs[-1]
+    )
+    if branch_id:
+        query = query.filter(models.LedgerEntry.branch_id == branch_id)
+
+    return query.group_by(period, year, models.Account.type, is_cogs).all()
+
+
 def get_financial_ratios(db: Session, business_id: int, branch_id: int, as_of_date: date) -> Dict[str, Any]:
     """
     Calculates key financial ratios for a specific date and their trends over the last 6 months.
     """
-    
-    def calculate_ratios_for_period(start_date: date, end_date: date):
-        pnl_data = crud.ledger.get_profit_and_loss_data(db, business_id, start_date, end_date, branch_id)
-        bs_data = crud.ledger.get_balance_sheet_data(db, business_id, end_date, branch_id)
-
-        total_revenue = pnl_data.get("total_revenue", 0.0)
-        gross_profit = pnl_data.get("gross_profit", 0.0)
-        net_profit = pnl_data.get("net_profit", 0.0)
-        
+    # The trend points are YTD figures at each of the last six month-ends; the last
+    # one is `as_of_date` itself, which doubles as the "current" figure.
+    cutoffs = [as_of_date - relativedelta(months=i) for i in range(5, -1, -1)]
+    periods = len(cutoffs)
+
+    revenue = [0.0] * periods
+    cogs = [0.0] * periods
+    expenses = [0.0] * periods
+    assets = [0.0] * periods
+    liabilities = [0.0] * periods
+
+    for row in _get_ledger_totals_by_period(db, business_id, branch_id, cutoffs):
+        amount = row.net_debit or 0.0
+        for k in range(row.period, periods):
+            if row.type == models.AccountType.ASSET:
+                assets[k] += amount
+            elif row.type == models.AccountType.LIABILITY:
+                liabilities[k] -= amount
+            elif cutoffs[k].year == row.year:
+                # P&L accounts only count towards the YTD window of their own year.
+                if row.type == models.AccountType.REVENUE:
+                    revenue[k] -= amount
+                elif row.type == models.AccountType.EXPENSE:
+                    expenses[k] += amount
+                    if row.is_cogs:
+                        cogs[k] += amount
+
+    def calculate_ratios(k: int):
+        total_revenue = revenue[k]
+        gross_profit = total_revenue - cogs[k]
+        net_profit = total_revenue - expenses[k]
+
         # For the Current Ratio, we need to identify current assets and liabilities.
         # For simplicity now, we'll consider all assets/liabilities as current. This can be refined later.
-        current_assets = bs_data.get("total_assets", 0.0)
-        current_liabilities = bs_data.get("total_liabilities", 0.0)
+        current_assets = assets[k]
+        current_liabilities = liabilities[k]
 
         # Calculate Ratios
         gross_profit_margin = (gross_profit / total_revenue * 100) if total_revenue else 0
         net_profit_margin = (net_profit / total_revenue * 100) if total_revenue else 0
         current_ratio = (current_assets / current_liabilities) if current_liabilities else 0
-        
+
         return {
             "gross_profit_margin": gross_profit_margin,
             "net_profit_margin": net_profit_margin,
             "current_ratio": current_ratio,
         }
 
-    # Calculate current ratios
-    start_of_year = as_of_date.replace(month=1, day=1)
-    current_ratios = calculate_ratios_for_period(start_of_year, as_of_date)
-
-    # Calculate trend data for the last 6 months
     trend_labels = []
     gpm_trend, npm_trend, cr_trend = [], [], []
 
-    for i in range(5, -1, -1):
-        month_end_date = as_of_date - relativedelta(months=i)
-        month_start_date = month_end_date.replace(day=1)
-        
+    for k, month_end_date in enumerate(cutoffs):
         trend_labels.append(month_end_date.strftime('%b'))
-        
-        # We calculate YTD ratios for each month-end to see the trend
-        ytd_start = month_end_date.replace(month=1, day=1)
-        monthly_ratios = calculate_ratios_for_period(ytd_start, month_end_date)
-        
+
+        monthly_ratios = calculate_ratios(k)
         gpm_trend.append(round(monthly_ratios["gross_profit_margin"], 2))
         npm_trend.append(round(monthly_ratios["net_profit_margin"], 2))
         cr_trend.append(round(monthly_ratios["current_ratio"], 2))
 
     return {
-        "current": current_ratios,
+        "current": calculate_ratios(periods - 1),
         "trends": {
             "labels": trend_labels,
             "gross_profit_margin": gpm_trend,
@@ -168,7 +230,7 @@ def get_cash_flow_forecast(
     db: Session, 
     business_id: int, 
     branch_id: int, 
-    scenarios: List[Dict[str, Any]]
+    scenarios: List[schemas.CashFlowScenario]
 ) -> Dict[str, Any]:
     """
     Generates a cash flow forecast using linear regression on historical data
@@ -184,72 +246,65 @@ def get_cash_flow_forecast(
     
     account_ids = [acc.id for acc in payment_accounts]
 
-    # Query to get daily net change in cash
-    daily_changes = db.query(
-        models.LedgerEntry.transaction_date,
-        func.sum(models.LedgerEntry.debit - models.LedgerEntry.credit).label('net_change')
+    # Daily net change in cash with a running balance computed by the database.
+    # Everything before the window is folded into one seed row dated the day before
+    # it starts, so the running sum already includes the opening balance.
+    opening_date = start_date_hist - timedelta(days=1)
+    balance_date = case(
+        (models.LedgerEntry.transaction_date < start_date_hist, opening_date),
+        else_=models.LedgerEntry.transaction_date
+    ).label('balance_date')
+    net_change = func.sum(models.LedgerEntry.debit - models.LedgerEntry.credit)
+
+    daily_balances = db.query(
+        balance_date,
+        func.sum(net_change).over(order_by=balance_date).label('balance')
     ).filter(
         models.LedgerEntry.account_id.in_(account_ids),
         models.LedgerEntry.branch_id == branch_id,
-        models.LedgerEntry.transaction_date.between(start_date_hist, today)
-    ).group_by(models.LedgerEntry.transaction_date).order_by(models.LedgerEntry.transaction_date).all()
-
-    # Calculate running balance for historical data
-    opening_balance = db.query(func.sum(models.LedgerEntry.debit - models.LedgerEntry.credit)).filter(
-        models.LedgerEntry.account_id.in_(account_ids),
-        models.LedgerEntry.branch_id == branch_id,
-        models.LedgerEntry.transaction_date < start_date_hist
-    ).scalar() or 0.0
-
-    balance = opening_balance
-    historical_balances = {}
-    for d in daily_changes:
-        balance += d.net_change
-        historical_balances[d.transaction_date] = balance
-
-    # Fill in missing days with the previous day's balance
-    running_date = start_date_hist
-    last_balance = opening_balance
-    processed_historical = []
-    labels = []
-    while running_date <= today:
-        labels.append(running_date.strftime('%Y-%m-%d'))
-        last_balance = historical_balances.get(running_date, last_balance)
-        processed_historical.append(round(last_balance, 2))
-        running_date += timedelta(days=1)
-
-    # 2. Simple Linear Regression Model
-    X = np.array(range(len(processed_historical))).reshape(-1, 1)
-    y = np.array(processed_historical)
-    model = LinearRegression()
-    model.fit(X, y)
+        models.LedgerEntry.transaction_date <= today
+    ).group_by(balance_date).order_by(balance_date).all()
+
+    # Forward-fill onto every day of the window: each day takes the balance of the
+    # latest row on or before it (days before any activity stay at zero).
+    total_days = (today - start_date_hist).days + 1
+    balance_dates = np.array([row.balance_date for row in daily_balances], dtype='datetime64[D]')
+    row_offsets = (balance_dates - np.datetime64(start_date_hist)).astype(np.int64)
+    row_balances = np.array([row.balance for row in daily_balances], dtype=np.float64)
+    latest_row = np.searchsorted(row_offsets, np.arange(total_days), side='right')
+    historical = np.concatenate(([0.0], row_balances))[latest_row]
+
+    # Kept as an array for the regression; converted to a list only for the response.
+    processed_historical = np.round(historical, 2)
+    labels = np.arange(
+        np.datetime64(start_date_hist), np.datetime64(today) + np.timedelta64(1, 'D')
+    ).astype(str).tolist()
+
+    # 2. Simple Linear Regression Model (closed-form least-squares line over the day index)
+    t = np.arange(len(processed_historical), dtype=np.float64)
+    slope, intercept = np.polyfit(t, processed_historical, 1)
 
     # 3. Project future balances
     forecast_days = 90
-    future_X = np.array(range(len(processed_historical), len(processed_historical) + forecast_days)).reshape(-1, 1)
-    base_forecast = model.predict(future_X)
+    future_t = np.arange(len(processed_historical), len(processed_historical) + forecast_days, dtype=np.float64)
+    base_forecast = slope * future_t + intercept
 
     # 4. Apply 'what-if' scenarios
-    adjusted_forecast = []
-    daily_scenario_impact = 0
-    for scenario in scenarios:
-        if scenario.get('type') == 'expense':
-            daily_scenario_impact -= float(scenario.get('amount', 0)) / 30.44 # Avg days in month
-        elif scenario.get('type') == 'income':
-            daily_scenario_impact += float(scenario.get('amount', 0)) / 30.44
-
-    for i, forecast_val in enumerate(base_forecast):
-        adjusted_val = forecast_val + (daily_scenario_impact * (i + 1))
-        adjusted_forecast.append(round(adjusted_val, 2))
-        if i == 0:
-            # The first day of forecast continues from the last historical day
-            labels.append((today + timedelta(days=1)).strftime('%Y-%m-%d'))
-        else:
-            labels.append((today + timedelta(days=i + 1)).strftime('%Y-%m-%d'))
+    signed_amounts = np.array(
+        [s.amount if s.type == 'income' else -s.amount for s in scenarios], dtype=np.float64
+    )
+    daily_scenario_impact = signed_amounts.sum() / 30.44 # Avg days in month
+
+    # Each forecast day carries the scenario impact accumulated up to that day.
+    forecast_offsets = np.arange(1, forecast_days + 1)
+    adjusted_forecast = np.round(base_forecast + daily_scenario_impact * forecast_offsets, 2).tolist()
+
+    # The first day of forecast continues from the last historical day
+    labels.extend((np.datetime64(today) + forecast_offsets).astype(str).tolist())
 
     return {
         "labels": labels,
-        "historical": processed_historical,
+        "historical": processed_historical.tolist(),
         "forecast": adjusted_forecast
     }
 
@@ -262,48 +317,44 @@ def get_metric_breakdown(db: Session, business_id: int, branch_id: int, metric:
     results = []
     
     if metric == "Total Expenses":
-        # Level 1: Group by Expense Category
-        expenses_by_category = db.query(
+        # One query for both levels (category -> individual expense); the rows are
+        # ordered by category so they can be bucketed in a single pass.
+        expenses = db.query(
             models.Expense.category,
-            func.sum(models.Expense.amount).label('total_amount')
+            models.Expense.description,
+            models.Expense.amount
         ).filter(
             models.Expense.business_id == business_id,
             models.Expense.expense_date.between(start_date, end_date)
         )
         if branch_id:
-            expenses_by_category = expenses_by_category.filter(models.Expense.branch_id == branch_id)
-            
-        expenses_by_category = expenses_by_category.group_by(models.Expense.category).all()
+            expenses = expenses.filter(models.Expense.branch_id == branch_id)
+
+        expenses = expenses.order_by(models.Expense.category, models.Expense.id).all()
 
-        for category_name, category_total in expenses_by_category:
+        for category_name, category_expenses in groupby(expenses, key=itemgetter(0)):
             category_node = {
                 "name": category_name,
-                "value": category_total,
+                "value": 0.0,
                 "children": []
             }
-            
-            # Level 2: Get individual expenses for this category
-            individual_expenses = db.query(models.Expense).filter(
-                models.Expense.business_id == business_id,
-                models.Expense.expense_date.between(start_date, end_date),
-                models.Expense.category == category_name
-            )
-            if branch_id:
-                individual_expenses = individual_expenses.filter(models.Expense.branch_id == branch_id)
-            
-            for expense in individual_expenses.all():
+            for _, description, amount in category_expenses:
+                category_node["value"] += amount
                 category_node["children"].append({
-                    "name": expense.description[:30] + '...' if len(expense.description) > 30 else expense.description,
-                    "value": expense.amount
+                    "name": description[:30] + '...' if len(description) > 30 else description,
+                    "value": amount
                 })
             results.append(category_node)
 
     elif metric == "Total Sales":
-        # Level 1: Group by Product Category
-        sales_by_category = db.query(
-            models.Category.name,
-            func.sum(models.SalesInvoiceItem.price * models.SalesInvoiceItem.quantity).label('total_revenue')
-        ).join(models.SalesInvoiceItem, models.SalesInvoice.id == models.SalesInvoiceItem.sales_invoice_id)\
+        # One aggregate grouped by (category, product) yields both levels of the tree;
+        # category totals are the sum of their products.
+        sales_by_product = db.query(
+            models.Category.name.label('category_name'),
+            models.Product.name.label('product_name'),
+            func.sum(models.SalesInvoiceItem.price * models.SalesInvoiceItem.quantity).label('product_total')
+        ).select_from(models.SalesInvoice)\
+         .join(models.SalesInvoiceItem, models.SalesInvoice.id == models.SalesInvoiceItem.sales_invoice_id)\
          .join(models.Product, models.Product.id == models.SalesInvoiceItem.product_id)\
          .join(models.Category, models.Category.id == models.Product.category_id)\
          .filter(
@@ -311,35 +362,19 @@ def get_metric_breakdown(db: Session, business_id: int, branch_id: int, metric:
             models.SalesInvoice.invoice_date.between(start_date, end_date)
         )
         if branch_id:
-            sales_by_category = sales_by_category.filter(models.SalesInvoice.branch_id == branch_id)
-            
-        sales_by_category = sales_by_category.group_by(models.Category.name).all()
+            sales_by_product = sales_by_product.filter(models.SalesInvoice.branch_id == branch_id)
 
-        for category_name, category_total in sales_by_category:
+        sales_by_product = sales_by_product.group_by(models.Category.name, models.Product.name)\
+            .order_by(models.Category.name, models.Product.name).all()
+
+        for category_name, category_products in groupby(sales_by_product, key=itemgetter(0)):
             category_node = {
                 "name": category_name,
-                "value": category_total,
+                "value": 0.0,
                 "children": []
             }
-            
-            # Level 2: Get individual products for this category
-            sales_by_product = db.query(
-                models.Product.name,
-                func.sum(models.SalesInvoiceItem.price * models.SalesInvoiceItem.quantity).label('product_total')
-            ).join(models.SalesInvoiceItem, models.SalesInvoice.id == models.SalesInvoiceItem.sales_invoice_id)\
-             .join(models.Product, models.Product.id == models.SalesInvoiceItem.product_id)\
-             .join(models.Category, models.Category.id == models.Product.category_id)\
-             .filter(
-                models.SalesInvoice.business_id == business_id,
-                models.SalesInvoice.invoice_date.between(start_date, end_date),
-                models.Category.name == category_name
-            )
-            if branch_id:
-                sales_by_product = sales_by_product.filter(models.SalesInvoice.branch_id == branch_id)
-            
-            sales_by_product = sales_by_product.group_by(models.Product.name).all()
-
-            for product_name, product_total in sales_by_product:
+            for _, product_name, product_total in category_products:
+                category_node["value"] += product_total
                 category_node["children"].append({
                     "name": product_name,
                     "value": product_total
@@ -1,9 +1,9 @@
 
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import desc, func
+from sqlalchemy import desc, func, tuple_, or_, and_, select, union_all
 from .. import models, schemas
 from datetime import date
-from typing import List
+from typing import List, Optional, Tuple
 
 def get_bank_accounts_by_branch(db: Session, branch_id: int):
     """Retrieves all user-created bank accounts for a specific branch."""
@@ -21,21 +21,19 @@ def create_bank_account(db: Session, account_data: schemas.BankAccountCreate, bu
         business_id=business_id,
         is_system_account=False # User-created
     )
-    db.add(new_chart_of_account)
-    db.flush() # To get the ID of the new account
 
-    # 2. Create the detailed BankAccount record.
+    # 2. Create the detailed BankAccount record, linked through the relationship so
+    #    both rows are inserted in the same flush at commit time.
     new_bank_account = models.BankAccount(
         account_name=account_data.account_name,
         bank_name=account_data.bank_name,
         account_number=account_data.account_number,
-        chart_of_account_id=new_chart_of_account.id,
+        chart_of_account=new_chart_of_account,
         branch_id=branch_id,
         business_id=business_id
     )
     db.add(new_bank_account)
     db.commit()
-    db.refresh(new_bank_account)
     return new_bank_account
 
 def get_payment_accounts(db: Session, business_id: int, branch_id: int):
@@ -43,23 +41,33 @@ def get_payment_accounts(db: Session, business_id: int, branch_id: int):
     Retrieves all accounts that can be used for payments for a specific branch.
     This now includes the user-created Bank Accounts and the system 'Cash' account.
     """
-    # Get user-created bank accounts for the branch by joining through the chart of accounts
+    # User-created bank accounts for the branch (joined through the chart of accounts)
+    # and the system 'Cash' account for the business, fetched together in one query
     bank_accounts = db.query(models.Account).join(models.BankAccount).filter(
         models.BankAccount.branch_id == branch_id
-    ).all()
-
-    # Get the system 'Cash' account for the business
+    )
     cash_account = db.query(models.Account).filter(
         models.Account.business_id == business_id,
         models.Account.name == 'Cash',
         models.Account.is_system_account == True
-    ).first()
+    )
+    return bank_accounts.union_all(cash_account).order_by(models.Account.name).all()
 
-    payment_accounts = bank_accounts
-    if cash_account:
-        payment_accounts.append(cash_account)
-    
-    return sorted(payment_accounts, key=lambda x: x.name)
+def select_payment_account_ids(business_id: int, branch_id: int):
+    """
+    A SELECT of the ids of the accounts get_payment_accounts returns, for use as an
+    IN subquery so the ids never have to be fetched into Python.
+    """
+    return union_all(
+        select(models.Account.id).join(models.BankAccount).where(
+            models.BankAccount.branch_id == branch_id
+        ),
+        select(models.Account.id).where(
+            models.Account.business_id == business_id,
+            models.Account.name == 'Cash',
+            models.Account.is_system_account == True
+        )
+    )
 
 def create_fund_transfer(db: Session, transfer_data: dict, business_id: int, branch_id: int):
     """
@@ -108,16 +116,23 @@ def create_fund_transfer(db: Session, transfer_data: dict, business_id: int, bra
     
     return new_transfer
 
-def get_fund_transfers_by_branch(db: Session, business_id: int, branch_id: int):
-    """Retrieves all Fund Transfer records for a specific branch."""
-    return db.query(models.FundTransfer)\
+def get_fund_transfers_by_branch(db: Session, business_id: int, branch_id: int, after: Optional[Tuple[date, int]] = None, limit: Optional[int] = None):
+    """
+    Retrieves Fund Transfer records for a specific branch, most recent first.
+    Pages by keyset: `after` is the (transfer_date, id) of the last transfer already shown.
+    """
+    query = db.query(models.FundTransfer)\
         .filter(
             models.FundTransfer.business_id == business_id,
             models.FundTransfer.branch_id == branch_id
         )\
-        .options(joinedload(models.FundTransfer.from_account), joinedload(models.FundTransfer.to_account))\
-        .order_by(desc(models.FundTransfer.transfer_date))\
-        .all()
+        .options(joinedload(models.FundTransfer.from_account), joinedload(models.FundTransfer.to_account))
+    if after is not None:
+        query = query.filter(tuple_(models.FundTransfer.transfer_date, models.FundTransfer.id) < tuple_(*after))
+    query = query.order_by(desc(models.FundTransfer.transfer_date), desc(models.FundTransfer.id))
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
 
 def get_unreconciled_transactions(db: Session, account_id: int, branch_id: int):
     """
@@ -133,14 +148,12 @@ def get_opening_balance_for_reconciliation(db: Session, account_id: int):
     """
     Calculates the opening balance for a new reconciliation.
     """
-    balance = db.query(
-        func.sum(models.LedgerEntry.debit - models.LedgerEntry.credit)
+    return db.query(
+        func.coalesce(func.sum(models.LedgerEntry.debit - models.LedgerEntry.credit), 0.0)
     ).filter(
         models.LedgerEntry.account_id == account_id,
         models.LedgerEntry.is_reconciled == True
     ).scalar()
-    
-    return balance or 0.0
 
 def process_reconciliation(db: Session, business_id: int, branch_id: int, account_id: int, statement_date: date, statement_balance: float, cleared_transaction_ids: List[int]):
     """
@@ -166,11 +179,12 @@ def process_reconciliation(db: Session, business_id: int, branch_id: int, accoun
             }, synchronize_session=False)
     
     # Update the summary on the BankAccount model
-    db_bank_account = db.query(models.BankAccount).filter(models.BankAccount.chart_of_account_id == account_id).first()
-    if db_bank_account:
-        db_bank_account.last_reconciliation_date = statement_date
-        db_bank_account.last_reconciliation_balance = statement_balance
-        db.add(db_bank_account)
+    db.query(models.BankAccount)\
+        .filter(models.BankAccount.chart_of_account_id == account_id)\
+        .update({
+            'last_reconciliation_date': statement_date,
+            'last_reconciliation_balance': statement_balance
+        }, synchronize_session=False)
         
     return reconciliation
 
@@ -194,17 +208,30 @@ def get_reconciliation_report_data(db: Session, reconciliation_id: int, business
 
     book_starting_balance = previous_reconciliation.statement_balance if previous_reconciliation else 0.0
 
-    # Get all transactions that were cleared in THIS reconciliation
-    cleared_transactions = db.query(models.LedgerEntry).filter(
-        models.LedgerEntry.reconciliation_id == reconciliation_id
-    ).order_by(models.LedgerEntry.transaction_date).all()
-
-    # Get all transactions for this account that were STILL not reconciled as of the statement date
-    uncleared_transactions = db.query(models.LedgerEntry).filter(
-        models.LedgerEntry.account_id == reconciliation.account_id,
-        models.LedgerEntry.is_reconciled == False,
-        models.LedgerEntry.transaction_date <= reconciliation.statement_date
-    ).order_by(models.LedgerEntry.transaction_date).all()
+    # In one scan, get all transactions that were cleared in THIS reconciliation and all
+    # transactions for this account that were STILL not reconciled as of the statement date.
+    # The report only reads a few columns, so plain rows are fetched instead of ORM entries.
+    is_cleared = models.LedgerEntry.reconciliation_id == reconciliation_id
+    transactions = db.execute(select(
+        models.LedgerEntry.id,
+        models.LedgerEntry.transaction_date,
+        models.LedgerEntry.description,
+        models.LedgerEntry.debit,
+        models.LedgerEntry.credit,
+        is_cleared.label("is_cleared")
+    ).where(
+        or_(
+            is_cleared,
+            and_(
+                models.LedgerEntry.account_id == reconciliation.account_id,
+                models.LedgerEntry.is_reconciled == False,
+                models.LedgerEntry.transaction_date <= reconciliation.statement_date
+            )
+        )
+    ).order_by(models.LedgerEntry.transaction_date)).all()
+
+    cleared_transactions = [entry for entry in transactions if entry.is_cleared]
+    uncleared_transactions = [entry for entry in transactions if not entry.is_cleared]
 
     return {
         "reconciliation": reconciliation,
@@ -1,5 +1,6 @@
 
 from sqlalchemy.orm import Session
+from sqlalchemy import select, func, or_
 from .. import models, schemas
 
 
@@ -11,8 +12,6 @@ def create_branch(db: Session, branch: schemas.BranchCreate, business_id: int, i
     db_branch = models.Branch(**branch.dict(), business_id=business_id, is_default=is_default)
     db.add(db_branch)
     db.commit()
-
-    db.refresh(db_branch)
     return db_branch
 
 
@@ -22,22 +21,19 @@ def get_branches_by_business(db: Session, business_id: int):
     return db.query(models.Branch).filter(models.Branch.business_id == business_id).order_by(models.Branch.name).all()
 
 def get_branch(db: Session, branch_id: int):
-    return db.query(models.Branch).filter(models.Branch.id == branch_id).first()
+    # Served from the session's identity map when the branch was already loaded in this request
+    return db.get(models.Branch, branch_id)
 
 
 def update_branch(db: Session, branch_id: int, branch_update: schemas.BranchUpdate):
-    db_branch = get_branch(db, branch_id=branch_id)
-    if not db_branch:
-        return None
-
     update_data = branch_update.dict(exclude_unset=True)
-    for key, value in update_data.items():
-        setattr(db_branch, key, value)
+    if update_data:
+        updated = db.query(models.Branch).filter(models.Branch.id == branch_id).update(update_data, synchronize_session=False)
+        if not updated:
+            return None
+        db.commit()
 
-    db.add(db_branch)
-    db.commit()
-    db.refresh(db_branch)
-    return db_branch
+    return get_branch(db, branch_id=branch_id)
 
 
 
@@ -46,19 +42,19 @@ def delete_branch(db: Session, branch_id: int, business_id: int) -> bool:
     Deletes a branch and all its associated data.
     Returns True on success, False on failure (e.g., branch not found or is default).
     """
+    # The safety check that prevents deleting the last remaining (default) branch is
+    # part of the lookup itself, so a branch that may not be deleted is simply not found.
+    branch_count = select(func.count(models.Branch.id)).where(
+        models.Branch.business_id == business_id
+    ).scalar_subquery()
     branch = db.query(models.Branch).filter(
         models.Branch.id == branch_id,
-        models.Branch.business_id == business_id
+        models.Branch.business_id == business_id,
+        or_(models.Branch.is_default.is_not(True), branch_count > 1)
     ).first()
 
     if not branch:
-        return False # Branch not found
-    
-    if branch.is_default:
-        # Add a safety check to prevent deleting the last remaining branch
-        branch_count = db.query(models.Branch).filter(models.Branch.business_id == business_id).count()
-        if branch_count <= 1:
-            return False # Cannot delete the last/default branch
+        return False # Branch not found, or it is the last/default branch
 
     # SQLAlchemy's cascade will handle deleting related records
     db.delete(branch)
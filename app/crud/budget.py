@@ -1,5 +1,5 @@
 
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.orm import Session, selectinload, raiseload
 from sqlalchemy import func
 from .. import models, schemas
 from datetime import date
@@ -9,11 +9,16 @@ def get_budgets_by_branch(db: Session, branch_id: int):
     """Retrieves all budgets for a specific branch."""
     return db.query(models.Budget).filter(models.Budget.branch_id == branch_id).order_by(models.Budget.start_date.desc()).all()
 
-def get_budget_by_id(db: Session, budget_id: int, branch_id: int):
-    """Retrieves a single budget with its lines, ensuring it belongs to the correct branch."""
-    return db.query(models.Budget).options(
-        joinedload(models.Budget.lines).joinedload(models.BudgetLine.account)
-    ).filter(
+def get_budget_by_id(db: Session, budget_id: int, branch_id: int, raise_on_lazy_load: bool = False):
+    """
+    Retrieves a single budget with its lines, ensuring it belongs to the correct branch.
+    With `raise_on_lazy_load`, any relationship not eagerly loaded here raises instead of
+    issuing a query, which keeps report code honest about what it touches.
+    """
+    options = [selectinload(models.Budget.lines).selectinload(models.BudgetLine.account)]
+    if raise_on_lazy_load:
+        options.append(raiseload('*'))
+    return db.query(models.Budget).options(*options).filter(
         models.Budget.id == budget_id,
         models.Budget.branch_id == branch_id
     ).first()
@@ -63,22 +68,27 @@ def get_budget_vs_actual_report(db: Session, budget: models.Budget):
     Generates a report comparing budgeted amounts to actual amounts from the ledger.
     """
     report_lines = []
-    
+
+    # Net debit per budgeted account over the budget period, in one grouped query
+    account_ids = {line.account_id for line in budget.lines}
+    net_debits = dict(db.query(
+        models.LedgerEntry.account_id,
+        func.sum(models.LedgerEntry.debit - models.LedgerEntry.credit)
+    ).filter(
+        models.LedgerEntry.account_id.in_(account_ids),
+        models.LedgerEntry.branch_id == budget.branch_id,
+        models.LedgerEntry.transaction_date.between(budget.start_date, budget.end_date)
+    ).group_by(models.LedgerEntry.account_id).all()) if account_ids else {}
+
     for line in budget.lines:
+        net_debit = net_debits.get(line.account_id) or 0.0
         # Determine the correct calculation based on account type
         if line.account.type == models.AccountType.REVENUE:
             # For Revenue: Actual = Credit - Debit
-            actual_amount_query = db.query(func.sum(models.LedgerEntry.credit - models.LedgerEntry.debit))
+            actual_amount = -net_debit or 0.0
         else: # Expense
             # For Expense: Actual = Debit - Credit
-            actual_amount_query = db.query(func.sum(models.LedgerEntry.debit - models.LedgerEntry.credit))
-
-        # Filter by account, branch, and the budget's date range
-        actual_amount = actual_amount_query.filter(
-            models.LedgerEntry.account_id == line.account_id,
-            models.LedgerEntry.branch_id == budget.branch_id,
-            models.LedgerEntry.transaction_date.between(budget.start_date, budget.end_date)
-        ).scalar() or 0.0
+            actual_amount = net_debit
 
         variance = actual_amount - line.amount
         
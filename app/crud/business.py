@@ -1,4 +1,7 @@
 from sqlalchemy.orm import Session
+from sqlalchemy import update, func, cast, Integer
+from sqlalchemy.exc import IntegrityError
+from typing import List
 from .. import models, schemas
 
 
@@ -10,3 +13,76 @@ def create_business(db: Session, name: str, plan: str = "premium"):
     db_business = models.Business(name=name, plan=plan)
     db.add(db_business)
     return db_business
+
+def get_business(db: Session, business_id: int):
+    """
+    Gets a business, memoized in `db.info` for the rest of the request's session.
+    The session holds only weak references to loaded objects, so the memo keeps the
+    Business alive and repeat lookups skip both the SELECT and the identity map miss.
+    """
+    businesses = db.info.setdefault("businesses", {})
+    if business_id not in businesses:
+        businesses[business_id] = db.get(models.Business, business_id)
+    return businesses[business_id]
+
+def _highest_document_number(db: Session, business_id: int, prefix: str, number_column) -> int:
+    """Returns the highest numeric suffix already issued for `prefix` in `number_column`, or 0."""
+    # Take the highest numeric suffix in SQL rather than trusting the newest row's number
+    document = number_column.class_
+    return db.query(
+        func.coalesce(func.max(cast(func.substr(number_column, len(prefix) + 2), Integer)), 0)
+    ).filter(
+        document.business_id == business_id,
+        number_column.like(f"{prefix}-%")
+    ).scalar()
+
+def peek_document_number(db: Session, business_id: int, prefix: str, number_column) -> str:
+    """
+    Returns the document number reserve_document_number would hand out next, for display
+    on preview pages. Read-only: nothing is reserved, so the number actually assigned on
+    save can differ if another document is created in between.
+    """
+    last_num = db.query(models.DocumentCounter.last_number).filter(
+        models.DocumentCounter.business_id == business_id,
+        models.DocumentCounter.prefix == prefix
+    ).scalar()
+    if last_num is None:
+        last_num = _highest_document_number(db, business_id, prefix, number_column)
+    return f"{prefix}-{last_num + 1:04d}"
+
+def reserve_document_number(db: Session, business_id: int, prefix: str, number_column) -> str:
+    """
+    Atomically reserves the next sequential document number (e.g. "EXP-0001") for a business.
+    The counter row is bumped with a single UPDATE ... RETURNING, so concurrent requests
+    never read the same last number. The first call for a prefix seeds the counter from the
+    highest number already issued in `number_column`; if another request seeds it at the same
+    time, the unique constraint rejects the second row and that caller retries the UPDATE.
+    DOES NOT COMMIT.
+    """
+    return reserve_document_numbers(db, business_id, prefix, number_column, 1)[0]
+
+def reserve_document_numbers(db: Session, business_id: int, prefix: str, number_column, count: int) -> List[str]:
+    """
+    Reserves a block of `count` consecutive document numbers with one counter bump,
+    the same way reserve_document_number reserves one. Used by bulk imports.
+    DOES NOT COMMIT.
+    """
+    counter = models.DocumentCounter
+    next_num = db.execute(
+        update(counter)
+        .where(counter.business_id == business_id, counter.prefix == prefix)
+        .values(last_number=counter.last_number + count)
+        .returning(counter.last_number)
+    ).scalar()
+
+    if next_num is None:
+        next_num = _highest_document_number(db, business_id, prefix, number_column) + count
+        try:
+            with db.begin_nested():
+                db.add(counter(business_id=business_id, prefix=prefix, last_number=next_num))
+        except IntegrityError:
+            # A concurrent request created the counter first; take the next numbers from it instead
+            return reserve_document_numbers(db, business_id, prefix, number_column, count)
+
+    # `next_num` is the last number of the block
+    return [f"{prefix}-{number:04d}" for number in range(next_num - count + 1, next_num + 1)]
@@ -1,16 +1,23 @@
 
 from sqlalchemy.orm import Session
+from sqlalchemy import tuple_
+from typing import Optional, Tuple
 from .. import models, schemas
 
 
-def get_customers_by_branch(db: Session, branch_id: int, business_id: int, skip: int = 0, limit: int = 100):
+def get_customers_by_branch(db: Session, branch_id: int, business_id: int, after: Optional[Tuple[str, int]] = None, limit: int = 100):
     """
     Retrieves all customer for a specific branch within a specific business.
+    Pages by keyset: `after` is the (name, id) of the last customer already shown,
+    so each page seeks straight to its rows instead of skipping over earlier ones.
     """
-    return db.query(models.Customer).filter(
+    query = db.query(models.Customer).filter(
         models.Customer.branch_id == branch_id,
         models.Customer.business_id == business_id # <-- Add this condition
-    ).order_by(models.Customer.name).offset(skip).limit(limit).all()
+    )
+    if after is not None:
+        query = query.filter(tuple_(models.Customer.name, models.Customer.id) > tuple_(*after))
+    return query.order_by(models.Customer.name, models.Customer.id).limit(limit).all()
 
 
 
@@ -22,7 +29,6 @@ def create_customer(db: Session, customer: schemas.CustomerCreate):
     db_customer = models.Customer(**customer.model_dump())
     db.add(db_customer)
     db.commit()
-    db.refresh(db_customer)
     return db_customer
 
 
@@ -30,29 +36,32 @@ def create_customer(db: Session, customer: schemas.CustomerCreate):
 def get_customer(db: Session, customer_id: int, business_id: int):
     """
     Gets a single customer by its ID, ensuring it belongs to the correct business.
+    Looks in the session's identity map first, so repeat lookups within a request
+    don't go back to the database.
     """
-    return db.query(models.Customer).filter(
-        models.Customer.id == customer_id,
-        models.Customer.business_id == business_id 
-    ).first()
+    db_customer = db.get(models.Customer, customer_id)
+    if db_customer is None or db_customer.business_id != business_id:
+        return None
+    return db_customer
 
 
 
 def update_customer(db: Session, customer_id: int, customer_update: schemas.CustomerUpdate, business_id: int):
     """
     Updates a customer's details, ensuring it belongs to the correct business.
+    The change is applied with a single UPDATE; the row is only loaded afterwards.
     """
-    db_customer = get_customer(db, customer_id=customer_id, business_id=business_id) 
-    if not db_customer:
-        return None
-
     update_data = customer_update.model_dump(exclude_unset=True)
-    for key, value in update_data.items():
-        setattr(db_customer, key, value)
+    if update_data:
+        updated = db.query(models.Customer).filter(
+            models.Customer.id == customer_id,
+            models.Customer.business_id == business_id
+        ).update(update_data, synchronize_session=False)
+        if not updated:
+            return None
+        db.commit()
 
-    db.commit()
-    db.refresh(db_customer)
-    return db_customer
+    return get_customer(db, customer_id=customer_id, business_id=business_id)
 
 
 
@@ -1,8 +1,9 @@
-from sqlalchemy.orm import Session, joinedload, subqueryload
+from sqlalchemy.orm import Session, joinedload, selectinload, contains_eager
+from sqlalchemy import insert, select, tuple_
 from datetime import date
 from .. import models, schemas
-from typing import List
-import math
+from typing import List, Dict, Optional, Tuple
+from math import ceil
 
 def create_employee(db: Session, employee: schemas.EmployeeCreate, business_id: int):
     """
@@ -43,30 +44,30 @@ def get_employees_by_business(db: Session, business_id: int, is_active: bool = N
 def get_employee_by_id(db: Session, employee_id: int, business_id: int):
     """
     Gets a single employee by ID, ensuring it belongs to the correct business.
-    Eagerly loads the payroll configuration to avoid extra queries.
+    Eagerly loads the payroll configuration to avoid extra queries, and looks in the
+    session's identity map first so repeat lookups within a request are free.
     """
-    return db.query(models.Employee).options(
-        joinedload(models.Employee.payroll_config)
-    ).filter(
-        models.Employee.id == employee_id,
-        models.Employee.business_id == business_id
-    ).first()
+    db_employee = db.get(models.Employee, employee_id, options=[joinedload(models.Employee.payroll_config)])
+    if db_employee is None or db_employee.business_id != business_id:
+        return None
+    return db_employee
 
 def update_employee(db: Session, employee_id: int, employee_update: schemas.EmployeeUpdate, business_id: int):
     """
     Updates an employee's personal details.
+    The change is applied with a single UPDATE; the row is only loaded afterwards.
     """
-    db_employee = get_employee_by_id(db, employee_id=employee_id, business_id=business_id)
-    if not db_employee:
-        return None
-    
     update_data = employee_update.model_dump(exclude_unset=True)
-    for key, value in update_data.items():
-        setattr(db_employee, key, value)
-        
-    db.commit()
-    db.refresh(db_employee)
-    return db_employee
+    if update_data:
+        updated = db.query(models.Employee).filter(
+            models.Employee.id == employee_id,
+            models.Employee.business_id == business_id
+        ).update(update_data, synchronize_session=False)
+        if not updated:
+            return None
+        db.commit()
+
+    return get_employee_by_id(db, employee_id=employee_id, business_id=business_id)
 
 def update_payroll_config(db: Session, employee_id: int, payroll_update: schemas.PayrollConfigUpdate, business_id: int):
     """
@@ -103,42 +104,39 @@ def update_employee_status(db: Session, employee_id: int, is_active: bool, busin
     db.refresh(db_employee)
     return db_employee
 
-def process_payroll_for_employee(
-    db: Session,
-    employee_id: int,
-    business_id: int,
-    pay_period_start: date,
-    pay_period_end: date,
-    additions: List[dict],
-    deductions: List[dict]
-):
+PAYROLL_ACCOUNT_NAMES = ("Salary Expense", "Payroll Liabilities", "PAYE Payable", "Pension Payable")
+
+def get_payroll_accounts(db: Session, business_id: int) -> Dict[str, models.Account]:
     """
-    Processes payroll for a single employee for a given period.
-    This function should be called within a transaction.
-    IT DOES NOT COMMIT.
+    Fetches the core payroll accounts of a business in a single query, keyed by name.
+    Raises ValueError if any of them is missing.
     """
-    employee = get_employee_by_id(db, employee_id=employee_id, business_id=business_id)
-    if not employee or not employee.payroll_config:
-        raise ValueError(f"Employee or payroll config not found for ID {employee_id}")
+    accounts = db.query(models.Account).filter(
+        models.Account.business_id == business_id,
+        models.Account.name.in_(PAYROLL_ACCOUNT_NAMES)
+    ).all()
+    payroll_accounts = {account.name: account for account in accounts}
+    if any(name not in payroll_accounts for name in PAYROLL_ACCOUNT_NAMES):
+        raise ValueError("Core payroll accounts are missing. Please check Chart of Accounts.")
+    return payroll_accounts
 
-    branch_id = employee.branch_id
+def _build_payslip(employee: models.Employee, pay_period_start: date, pay_period_end: date, additions: List[dict], deductions: List[dict]):
+    """
+    Calculates an employee's pay for the period and returns the unsaved Payslip
+    together with the total of the additions, which the ledger postings need.
+    """
     config = employee.payroll_config
-    
-    salary_expense_account = db.query(models.Account).filter_by(business_id=business_id, name="Salary Expense").first()
-    payroll_liabilities_account = db.query(models.Account).filter_by(business_id=business_id, name="Payroll Liabilities").first()
-    paye_payable_account = db.query(models.Account).filter_by(business_id=business_id, name="PAYE Payable").first()
-    pension_payable_account = db.query(models.Account).filter_by(business_id=business_id, name="Pension Payable").first()
-
-    if not all([salary_expense_account, payroll_liabilities_account, paye_payable_account, pension_payable_account]):
-        raise ValueError("Core payroll accounts are missing. Please check Chart of Accounts.")
 
     gross_pay = config.gross_salary
     total_additions = sum(item['amount'] for item in additions)
     taxable_income = gross_pay + total_additions
     
-    paye_deduction = math.ceil(taxable_income * (config.paye_rate or 0.0))
-    pension_employee_deduction = math.ceil(gross_pay * (config.pension_employee_rate or 0.0))
-    pension_employer_contribution = math.ceil(gross_pay * (config.pension_employer_rate or 0.0))
+    paye_rate = config.paye_rate or 0.0
+    pension_employee_rate = config.pension_employee_rate or 0.0
+    pension_employer_rate = config.pension_employer_rate or 0.0
+    paye_deduction, pension_employee_deduction, pension_employer_contribution = (
+        ceil(taxable_income * paye_rate), ceil(gross_pay * pension_employee_rate), ceil(gross_pay * pension_employer_rate)
+    )
     
     other_deductions = sum(item['amount'] for item in deductions)
     total_deductions = paye_deduction + pension_employee_deduction + other_deductions
@@ -157,59 +155,144 @@ def process_payroll_for_employee(
         total_deductions=total_deductions,
         net_pay=net_pay
     )
-    for item in additions:
-        db_payslip.additions.append(models.PayslipAddition(**item))
-    for item in deductions:
-        db_payslip.deductions.append(models.PayslipDeduction(**item))
-    db.add(db_payslip)
-    db.flush()
+    return db_payslip, total_additions
 
-    total_payroll_expense = gross_pay + total_additions + pension_employer_contribution
+def _payroll_ledger_rows(
+    employee: models.Employee,
+    db_payslip: models.Payslip,
+    total_additions: float,
+    payroll_accounts: Dict[str, models.Account],
+    pay_period_start: date,
+    pay_period_end: date
+) -> List[dict]:
+    """
+    Builds the ledger postings for a flushed payslip as plain dicts.
+    Every row carries both debit and credit so a batch of them shares one INSERT.
+    """
+    branch_id = employee.branch_id
+    total_payroll_expense = db_payslip.gross_pay + total_additions + db_payslip.pension_employer_contribution
     
-    db.add(models.LedgerEntry(
-        transaction_date=date.today(),
-        description=f"Payroll for {employee.full_name} ({pay_period_start} to {pay_period_end})",
-        debit=total_payroll_expense, account_id=salary_expense_account.id, payslip_id=db_payslip.id, branch_id=branch_id
-    ))
-    db.add(models.LedgerEntry(
-        transaction_date=date.today(), description=f"Net pay for {employee.full_name}",
-        credit=net_pay, account_id=payroll_liabilities_account.id, payslip_id=db_payslip.id, branch_id=branch_id
-    ))
-    if paye_deduction > 0:
-        db.add(models.LedgerEntry(
+    ledger_rows = [
+        dict(
+            transaction_date=date.today(),
+            description=f"Payroll for {employee.full_name} ({pay_period_start} to {pay_period_end})",
+            debit=total_payroll_expense, credit=0.0, account_id=payroll_accounts["Salary Expense"].id, payslip_id=db_payslip.id, branch_id=branch_id
+        ),
+        dict(
+            transaction_date=date.today(), description=f"Net pay for {employee.full_name}",
+            debit=0.0, credit=db_payslip.net_pay, account_id=payroll_accounts["Payroll Liabilities"].id, payslip_id=db_payslip.id, branch_id=branch_id
+        ),
+    ]
+    if db_payslip.paye_deduction > 0:
+        ledger_rows.append(dict(
             transaction_date=date.today(), description=f"PAYE for {employee.full_name}",
-            credit=paye_deduction, account_id=paye_payable_account.id, payslip_id=db_payslip.id, branch_id=branch_id
+            debit=0.0, credit=db_payslip.paye_deduction, account_id=payroll_accounts["PAYE Payable"].id, payslip_id=db_payslip.id, branch_id=branch_id
         ))
-    total_pension_contribution = pension_employee_deduction + pension_employer_contribution
+    total_pension_contribution = db_payslip.pension_employee_deduction + db_payslip.pension_employer_contribution
     if total_pension_contribution > 0:
-        db.add(models.LedgerEntry(
+        ledger_rows.append(dict(
             transaction_date=date.today(), description=f"Pension for {employee.full_name}",
-            credit=total_pension_contribution, account_id=pension_payable_account.id, payslip_id=db_payslip.id, branch_id=branch_id
+            debit=0.0, credit=total_pension_contribution, account_id=payroll_accounts["Pension Payable"].id, payslip_id=db_payslip.id, branch_id=branch_id
         ))
-        
-    return db_payslip
+    return ledger_rows
 
-def get_payslips_by_business(db: Session, business_id: int):
+def process_payroll_batch(
+    db: Session,
+    business_id: int,
+    branch_id: int,
+    pay_period_start: date,
+    pay_period_end: date,
+    payroll_items: List[dict]
+) -> List[models.Payslip]:
     """
-    Retrieves all payslips for a business, ordered by most recent pay date.
+    Processes payroll for several employees of a branch in one pass.
+    Each item is a dict with `employee_id` and optional `additions`/`deductions` lists.
+    Employees, their payroll configs and the payroll accounts are loaded once, and the
+    payslips, their additions/deductions and the ledger postings are each written in a batch.
+    This function should be called within a transaction.
+    IT DOES NOT COMMIT.
     """
-    return db.query(models.Payslip).join(models.Employee).filter(
+    employee_ids = {item['employee_id'] for item in payroll_items}
+    employees = {
+        employee.id: employee
+        for employee in db.query(models.Employee).options(
+            selectinload(models.Employee.payroll_config)
+        ).filter(
+            models.Employee.id.in_(employee_ids),
+            models.Employee.business_id == business_id
+        ).all()
+    }
+    payroll_accounts = get_payroll_accounts(db, business_id=business_id)
+
+    batch = []
+    for item in payroll_items:
+        employee = employees.get(item['employee_id'])
+        # Security check: ensure the employee belongs to the active branch
+        if not employee or employee.branch_id != branch_id:
+            raise ValueError("Attempted to run payroll for an employee not in the active branch.")
+        if not employee.payroll_config:
+            raise ValueError(f"Employee or payroll config not found for ID {employee.id}")
+
+        additions = item.get('additions', [])
+        deductions = item.get('deductions', [])
+        db_payslip, total_additions = _build_payslip(employee, pay_period_start, pay_period_end, additions, deductions)
+        batch.append((employee, db_payslip, total_additions, additions, deductions))
+
+    payslips = [db_payslip for _, db_payslip, _, _, _ in batch]
+    db.add_all(payslips)
+    db.flush()
+
+    addition_rows, deduction_rows, ledger_rows = [], [], []
+    for employee, db_payslip, total_additions, additions, deductions in batch:
+        addition_rows.extend({**item, "payslip_id": db_payslip.id} for item in additions)
+        deduction_rows.extend({**item, "payslip_id": db_payslip.id} for item in deductions)
+        ledger_rows.extend(_payroll_ledger_rows(employee, db_payslip, total_additions, payroll_accounts, pay_period_start, pay_period_end))
+
+    if addition_rows:
+        db.execute(insert(models.PayslipAddition), addition_rows)
+    if deduction_rows:
+        db.execute(insert(models.PayslipDeduction), deduction_rows)
+    db.execute(insert(models.LedgerEntry), ledger_rows)
+
+    return payslips
+
+def get_payslips_by_business(db: Session, business_id: int, after: Optional[Tuple[date, int]] = None, limit: Optional[int] = None):
+    """
+    Retrieves payslips for a business, ordered by most recent pay date.
+    Pages by keyset: `after` is the (pay_date, id) of the last payslip already shown,
+    so later pages seek straight to their rows instead of skipping over earlier ones.
+    Returns read-only rows with the columns the history list shows plus `employee_name`.
+    """
+    stmt = select(
+        models.Payslip.id,
+        models.Payslip.pay_date,
+        models.Payslip.pay_period_start,
+        models.Payslip.pay_period_end,
+        models.Payslip.gross_pay,
+        models.Payslip.total_deductions,
+        models.Payslip.net_pay,
+        models.Employee.full_name.label("employee_name")
+    ).join(models.Payslip.employee).where(
         models.Employee.business_id == business_id
-    ).options(
-        joinedload(models.Payslip.employee)
-    ).order_by(models.Payslip.pay_date.desc()).all()
+    )
+    if after is not None:
+        stmt = stmt.where(tuple_(models.Payslip.pay_date, models.Payslip.id) < tuple_(*after))
+    stmt = stmt.order_by(models.Payslip.pay_date.desc(), models.Payslip.id.desc())
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return db.execute(stmt).all()
 
 def get_payslip_by_id(db: Session, payslip_id: int, business_id: int):
     """
     Retrieves a single payslip by its ID, ensuring it belongs to the business.
     """
-    return db.query(models.Payslip).join(models.Employee).filter(
+    return db.query(models.Payslip).join(models.Payslip.employee).filter(
         models.Payslip.id == payslip_id,
         models.Employee.business_id == business_id
     ).options(
-        joinedload(models.Payslip.employee).joinedload(models.Employee.branch),
-        subqueryload(models.Payslip.additions),
-        subqueryload(models.Payslip.deductions)
+        contains_eager(models.Payslip.employee).joinedload(models.Employee.branch),
+        selectinload(models.Payslip.additions),
+        selectinload(models.Payslip.deductions)
     ).first()
 
 def get_payslips_by_employee(db: Session, employee_id: int):
@@ -1,7 +1,28 @@
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import desc
+from sqlalchemy.orm import Session, joinedload, raiseload, contains_eager
+from sqlalchemy import desc, insert, or_, tuple_, select, bindparam
 from .. import models
+from .business import reserve_document_number, get_business
+from collections import OrderedDict
 from datetime import date
+from decimal import Decimal
+from typing import List, Optional, Tuple
+import time
+
+# Read statements are built once at import; each call only adds its filters or binds its parameters.
+_EXPENSE_LIST_STMT = select(models.Expense)\
+    .options(
+        joinedload(models.Expense.branch),
+        joinedload(models.Expense.vendor),
+        raiseload('*')
+    )\
+    .order_by(desc(models.Expense.expense_date), desc(models.Expense.id))
+
+_EXPENSE_ACCOUNTS_STMT = select(models.Account.id, models.Account.name)\
+    .where(
+        models.Account.business_id == bindparam("business_id"),
+        models.Account.type == models.AccountType.EXPENSE
+    )\
+    .order_by(models.Account.name)
 
 def create_expense(db: Session, expense_data: dict):
     """
@@ -9,12 +30,24 @@ def create_expense(db: Session, expense_data: dict):
     """
     business_id = expense_data['business_id']
     branch_id = expense_data['branch_id']
-    business = db.query(models.Business).filter(models.Business.id == business_id).first()
 
-    # Fetch necessary accounts
-    expense_account = db.query(models.Account).filter_by(id=expense_data['expense_account_id'], business_id=business_id).first()
-    paid_from_account = db.query(models.Account).filter_by(id=expense_data['paid_from_account_id'], business_id=business_id).first()
-    vat_account = db.query(models.Account).filter_by(business_id=business_id, name="VAT Receivable (Input VAT)").first()
+    # Fetch the expense, payment and VAT accounts, and their business, in a single query
+    accounts = db.query(models.Account)\
+        .join(models.Account.business)\
+        .options(contains_eager(models.Account.business))\
+        .filter(
+            models.Account.business_id == business_id,
+            or_(
+                models.Account.id.in_([expense_data['expense_account_id'], expense_data['paid_from_account_id']]),
+                models.Account.name == "VAT Receivable (Input VAT)"
+            )
+        ).all()
+    # Loaded by the query above, so this needs no SELECT of its own
+    business = get_business(db, business_id)
+    accounts_by_id = {account.id: account for account in accounts}
+    expense_account = accounts_by_id.get(expense_data['expense_account_id'])
+    paid_from_account = accounts_by_id.get(expense_data['paid_from_account_id'])
+    vat_account = next((account for account in accounts if account.name == "VAT Receivable (Input VAT)"), None)
 
     if not expense_account or not paid_from_account:
         raise ValueError("A required account for this transaction could not be found.")
@@ -23,7 +56,8 @@ def create_expense(db: Session, expense_data: dict):
 
     sub_total = expense_data['sub_total']
     vat_amount = expense_data['vat_amount'] if business.is_vat_registered else 0
-    total_amount = sub_total + vat_amount
+    # Added as Decimal so e.g. 0.1 + 0.2 is stored as 0.3 rather than 0.30000000000000004
+    total_amount = float(Decimal(str(sub_total)) + Decimal(str(vat_amount)))
 
     new_expense = models.Expense(
         expense_number=get_next_expense_number(db, business_id=business_id),
@@ -44,75 +78,109 @@ def create_expense(db: Session, expense_data: dict):
     description = f"Expense {new_expense.expense_number}: {new_expense.description}"
 
     # --- UPDATED ACCOUNTING ENTRIES ---
-    # 1. Debit the Expense account for the NET amount
-    db.add(models.LedgerEntry(
-        transaction_date=new_expense.expense_date, description=description,
-        debit=sub_total, account_id=new_expense.expense_account_id, branch_id=branch_id, vendor_id=new_expense.vendor_id
-    ))
+    # Collected as rows and written with one executemany INSERT
+    ledger_rows = [
+        # 1. Debit the Expense account for the NET amount
+        dict(
+            transaction_date=new_expense.expense_date, description=description,
+            debit=sub_total, credit=0.0, account_id=new_expense.expense_account_id, branch_id=branch_id, vendor_id=new_expense.vendor_id
+        ),
+    ]
     # 2. Debit VAT Receivable for the VAT amount
     if business.is_vat_registered and vat_amount > 0:
-        db.add(models.LedgerEntry(
+        ledger_rows.append(dict(
             transaction_date=new_expense.expense_date, description=f"Input VAT on {new_expense.expense_number}",
-            debit=vat_amount, account_id=vat_account.id, branch_id=branch_id, vendor_id=new_expense.vendor_id
+            debit=vat_amount, credit=0.0, account_id=vat_account.id, branch_id=branch_id, vendor_id=new_expense.vendor_id
         ))
     # 3. Credit the payment account (Cash/Bank) for the FULL amount
-    db.add(models.LedgerEntry(
+    ledger_rows.append(dict(
         transaction_date=new_expense.expense_date, description=description,
-        credit=total_amount, account_id=new_expense.paid_from_account_id, branch_id=branch_id, vendor_id=new_expense.vendor_id
+        debit=0.0, credit=total_amount, account_id=new_expense.paid_from_account_id, branch_id=branch_id, vendor_id=new_expense.vendor_id
     ))
+    db.execute(insert(models.LedgerEntry), ledger_rows, execution_options={"render_nulls": True})
     
     return new_expense
 
-def get_expenses_by_business(db: Session, business_id: int):
+def get_expenses_by_business(db: Session, business_id: int, after: Optional[Tuple[date, int]] = None, limit: Optional[int] = None):
     """
-    Retrieves all expenses for a business, ordered by most recent.
-    Eagerly loads related branch and vendor info to prevent extra queries.
+    Retrieves expenses for a business, ordered by most recent.
+    Eagerly loads related branch and vendor info; any other relationship access raises
+    instead of issuing a query per row.
+    Pages by keyset: `after` is the (expense_date, id) of the last expense already shown.
     """
-    return db.query(models.Expense)\
-        .filter(models.Expense.business_id == business_id)\
-        .options(
-            joinedload(models.Expense.branch),
-            joinedload(models.Expense.vendor)
-        )\
-        .order_by(desc(models.Expense.expense_date))\
-        .all()
+    stmt = _EXPENSE_LIST_STMT.where(models.Expense.business_id == business_id)
+    if after is not None:
+        stmt = stmt.where(tuple_(models.Expense.expense_date, models.Expense.id) < tuple_(*after))
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return db.scalars(stmt).all()
 
 
-def get_expenses_by_branch(db: Session, business_id: int, branch_id: int): # Renamed for clarity
+def get_expenses_by_branch(db: Session, business_id: int, branch_id: int, after: Optional[Tuple[date, int]] = None, limit: Optional[int] = None, search: Optional[str] = None): # Renamed for clarity
     """
-    Retrieves all expenses for a specific branch, ordered by most recent.
-    Eagerly loads related branch and vendor info to prevent extra queries.
+    Retrieves expenses for a specific branch, ordered by most recent.
+    Eagerly loads related branch and vendor info; any other relationship access raises
+    instead of issuing a query per row.
+    Pages by keyset: `after` is the (expense_date, id) of the last expense already shown.
+    `search` matches the category, description or vendor name across the whole history.
     """
-    return db.query(models.Expense)\
-        .filter(
-            models.Expense.business_id == business_id,
-            models.Expense.branch_id == branch_id  
-        )\
-        .options(
-            joinedload(models.Expense.branch),
-            joinedload(models.Expense.vendor)
-        )\
-        .order_by(desc(models.Expense.expense_date))\
-        .all()
+    stmt = _EXPENSE_LIST_STMT.where(
+        models.Expense.business_id == business_id,
+        models.Expense.branch_id == branch_id
+    )
+    if search:
+        pattern = f"%{search}%"
+        stmt = stmt.where(or_(
+            models.Expense.category.ilike(pattern),
+            models.Expense.description.ilike(pattern),
+            models.Expense.vendor_id.in_(
+                select(models.Vendor.id).where(
+                    models.Vendor.business_id == business_id,
+                    models.Vendor.name.ilike(pattern)
+                )
+            )
+        ))
+    if after is not None:
+        stmt = stmt.where(tuple_(models.Expense.expense_date, models.Expense.id) < tuple_(*after))
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return db.scalars(stmt).all()
+
+# Expense account lists change rarely, so they are kept per process for a short TTL.
+# Entries hold plain (id, name) rows, never ORM objects, so they outlive the session.
+EXPENSE_ACCOUNTS_CACHE_TTL = 60
+EXPENSE_ACCOUNTS_CACHE_SIZE = 1024
+_expense_accounts_cache: "OrderedDict[int, Tuple[float, List]]" = OrderedDict()
+
 def get_expense_accounts(db: Session, business_id: int):
     """
-    Retrieves all accounts of type 'Expense' for a given business,
+    Retrieves the (id, name) of all accounts of type 'Expense' for a given business,
     to be used for populating the category dropdown.
+    Served from a per-process cache for up to EXPENSE_ACCOUNTS_CACHE_TTL seconds;
+    account changes in this process clear it via invalidate_expense_accounts.
     """
-    return db.query(models.Account)\
-        .filter(
-            models.Account.business_id == business_id, 
-            models.Account.type == models.AccountType.EXPENSE
-        )\
-        .order_by(models.Account.name)\
-        .all()
+    entry = _expense_accounts_cache.get(business_id)
+    if entry is not None and entry[0] > time.monotonic():
+        _expense_accounts_cache.move_to_end(business_id)
+        return list(entry[1])
+
+    accounts = db.execute(_EXPENSE_ACCOUNTS_STMT, {"business_id": business_id}).all()
+    _expense_accounts_cache[business_id] = (time.monotonic() + EXPENSE_ACCOUNTS_CACHE_TTL, accounts)
+    _expense_accounts_cache.move_to_end(business_id)
+    while len(_expense_accounts_cache) > EXPENSE_ACCOUNTS_CACHE_SIZE:
+        _expense_accounts_cache.popitem(last=False)
+    return list(accounts)
+
+def invalidate_expense_accounts(business_id: int) -> None:
+    """Drops a business's cached expense account list after its chart of accounts changes."""
+    _expense_accounts_cache.pop(business_id, None)
 
 def get_expense_by_id(db: Session, expense_id: int, business_id: int):
     """Fetches a single expense by its ID, ensuring it belongs to the business."""
-    return db.query(models.Expense).filter(
-        models.Expense.id == expense_id,
-        models.Expense.business_id == business_id
-    ).first()
+    expense = db.get(models.Expense, expense_id)
+    if expense is None or expense.business_id != business_id:
+        return None
+    return expense
 
 def delete_expense_and_reverse_ledger(db: Session, expense: models.Expense):
     """
@@ -120,38 +188,32 @@ def delete_expense_and_reverse_ledger(db: Session, expense: models.Expense):
     """
     reversal_description = f"Reversal of expense: {expense.description}"
     branch_id = expense.branch_id
-    credit_reversal = models.LedgerEntry(
-        transaction_date=date.today(), 
-        description=reversal_description,
-        credit=expense.amount,
-        account_id=expense.expense_account_id,
-        vendor_id=expense.vendor_id,
-        branch_id=branch_id
-    )
-    debit_reversal = models.LedgerEntry(
-        transaction_date=date.today(),
-        description=reversal_description,
-        debit=expense.amount,
-        account_id=expense.paid_from_account_id,
-        vendor_id=expense.vendor_id,
-        branch_id=branch_id
-    )
+    reversal_rows = [
+        dict(
+            transaction_date=date.today(), 
+            description=reversal_description,
+            debit=0.0,
+            credit=expense.amount,
+            account_id=expense.expense_account_id,
+            vendor_id=expense.vendor_id,
+            branch_id=branch_id
+        ),
+        dict(
+            transaction_date=date.today(),
+            description=reversal_description,
+            debit=expense.amount,
+            credit=0.0,
+            account_id=expense.paid_from_account_id,
+            vendor_id=expense.vendor_id,
+            branch_id=branch_id
+        ),
+    ]
     
-    db.add_all([credit_reversal, debit_reversal])
+    db.execute(insert(models.LedgerEntry), reversal_rows, execution_options={"render_nulls": True})
     db.delete(expense)
 
 def get_next_expense_number(db: Session, business_id: int) -> str:
-    """Calculates the next sequential expense number for a given business."""
-    last_expense = db.query(models.Expense.expense_number)\
-        .filter(models.Expense.business_id == business_id)\
-        .order_by(desc(models.Expense.id))\
-        .first()
-
-    if not last_expense:
-        return "EXP-0001"
-
-    last_num = int(last_expense[0].split('-')[-1])
-    new_num = last_num + 1
-    return f"EXP-{new_num:04d}"
+    """Reserves the next sequential expense number for a given business."""
+    return reserve_document_number(db, business_id, "EXP", models.Expense.expense_number)
 
 
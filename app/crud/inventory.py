@@ -1,7 +1,8 @@
 
-from sqlalchemy.orm import Session, joinedload, subqueryload
+from sqlalchemy.orm import Session, joinedload, selectinload, contains_eager, raiseload
 from .. import models, schemas
-from sqlalchemy import desc, asc
+from sqlalchemy import desc, asc, insert, select, tuple_, update, case
+from typing import Dict, List, Optional, Tuple
 
 
 
@@ -23,8 +24,7 @@ def create_category(db: Session, category: schemas.CategoryCreate, business_id:
         branch_id=branch_id 
     )
     db.add(db_category)
-    db.commit()
-    db.refresh(db_category)
+    db.flush()
     return db_category
 
 
@@ -36,14 +36,11 @@ def update_category(db: Session, category_id: int, category_update: schemas.Cate
         update_data = category_update.model_dump(exclude_unset=True)
         for key, value in update_data.items():
             setattr(db_category, key, value)
-        db.commit()
-        db.refresh(db_category)
     return db_category
 def delete_category(db: Session, category_id: int):
     db_category = db.query(models.Category).filter(models.Category.id == category_id).first()
     if db_category:
         db.delete(db_category)
-        db.commit()
     return db_category
 
 # === Product CRUD ===
@@ -52,44 +49,75 @@ def get_product(db: Session, product_id: int, branch_id: int):
 def get_products_by_branch(db: Session, branch_id: int):
     return db.query(models.Product).filter(models.Product.branch_id == branch_id).order_by(models.Product.name).all()
 
-def create_product(db: Session, product: schemas.ProductCreate, branch_id: int):
+def create_product(db: Session, product: schemas.ProductCreate, branch_id: int, business_id: int):
 
     db_product = models.Product(
         **product.model_dump(), 
         stock_quantity=product.opening_stock, 
-        branch_id=branch_id
+        branch_id=branch_id,
+        business_id=business_id
     )
     db.add(db_product)
-    db.commit()
-    db.refresh(db_product)
+    db.flush()
     return db_product
 
+def create_products_bulk(db: Session, products: List[schemas.ProductCreate], branch_id: int, business_id: int):
+    """
+    Creates many products in one branch with a single executemany INSERT, for imports.
+    DOES NOT COMMIT.
+    """
+    product_rows = [
+        dict(
+            **product.model_dump(),
+            stock_quantity=product.opening_stock,
+            branch_id=branch_id,
+            business_id=business_id
+        )
+        for product in products
+    ]
+    db.execute(insert(models.Product), product_rows, execution_options={"render_nulls": True})
+
+def adjust_stock_quantities(db: Session, deltas: Dict[int, float]):
+    """
+    Adds each product's delta to its stock in one UPDATE, with the change applied in SQL
+    so concurrent postings cannot overwrite each other. Unknown product ids are skipped.
+    DOES NOT COMMIT.
+    """
+    if not deltas:
+        return
+    db.execute(
+        update(models.Product)
+        .where(models.Product.id.in_(deltas))
+        .values(stock_quantity=models.Product.stock_quantity + case(deltas, value=models.Product.id))
+    )
+
 def update_product(db: Session, product_id: int, product_update: schemas.ProductUpdate):
     db_product = db.query(models.Product).filter(models.Product.id == product_id).first()
     if db_product:
         update_data = product_update.model_dump(exclude_unset=True)
         for key, value in update_data.items():
             setattr(db_product, key, value)
-        db.commit()
-        db.refresh(db_product)
     return db_product
 
 def delete_product(db: Session, product_id: int):
     db_product = db.query(models.Product).filter(models.Product.id == product_id).first()
     if db_product:
         db.delete(db_product)
-        db.commit()
     return db_product
 
-def get_products_by_business(db: Session, business_id: int):
+def get_products_by_business(db: Session, business_id: int, after: Optional[Tuple[str, int]] = None, limit: Optional[int] = None):
     """
-    Retrieves all products for a specific business by joining through the branch.
+    Retrieves products for a specific business using the denormalized business_id.
+    Pages by keyset: `after` is the (name, id) of the last product already shown.
     """
-    return db.query(models.Product)\
-        .join(models.Branch)\
-        .filter(models.Branch.business_id == business_id)\
-        .order_by(models.Product.name)\
-        .all()
+    query = db.query(models.Product)\
+        .filter(models.Product.business_id == business_id)
+    if after is not None:
+        query = query.filter(tuple_(models.Product.name, models.Product.id) > tuple_(*after))
+    query = query.order_by(models.Product.name, models.Product.id)
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
 
 
 def get_product_with_details(db: Session, product_id: int, business_id: int):
@@ -97,7 +125,7 @@ def get_product_with_details(db: Session, product_id: int, business_id: int):
     Gets a single product and eagerly loads its category and stock adjustments.
     """
     return db.query(models.Product).join(models.Branch).options(
-        subqueryload(models.Product.stock_adjustments).joinedload(models.StockAdjustment.user),
+        selectinload(models.Product.stock_adjustments).joinedload(models.StockAdjustment.user),
         joinedload(models.Product.category)
     ).filter(
         models.Product.id == product_id,
@@ -110,10 +138,17 @@ def get_product_with_details(db: Session, product_id: int, business_id: int):
 def create_stock_adjustment(db: Session, adjustment: schemas.StockAdjustmentCreate, product_id: int, user_id: int):
     """
     Creates a stock adjustment record AND updates the product's stock quantity.
-    This function handles its own transaction commit because it's a self-contained unit of work.
+    The quantity is changed with a single UPDATE ... RETURNING, so no row lock is held
+    across Python code and concurrent adjustments cannot overwrite each other.
+    DOES NOT COMMIT; the caller commits the request's transaction.
     """
 
-    db_product = db.query(models.Product).filter(models.Product.id == product_id).with_for_update().first()
+    db_product = db.scalars(
+        update(models.Product)
+        .where(models.Product.id == product_id)
+        .values(stock_quantity=models.Product.stock_quantity + adjustment.quantity_change)
+        .returning(models.Product)
+    ).first()
     
     if not db_product:
         return None
@@ -125,39 +160,41 @@ def create_stock_adjustment(db: Session, adjustment: schemas.StockAdjustmentCrea
         reason=adjustment.reason
     )
     db.add(db_adjustment)
-
-  
-    db_product.stock_quantity += adjustment.quantity_change
-
-    try:
-        db.commit()
-        db.refresh(db_product)
-        return db_product
-    except Exception:
-        db.rollback()
-
-        return None
+    db.flush()
+    return db_product
 
 
 def get_product_by_id(db: Session, product_id: int):
     """
-    Gets a single product by its ID.
+    Gets a single product by its ID, from the session's identity map when already loaded.
     """
-    return db.query(models.Product).filter(models.Product.id == product_id).first()
+    return db.get(models.Product, product_id)
 
 
-def get_stock_adjustments_by_business(db: Session, business_id: int):
+def get_stock_adjustments_by_business(db: Session, business_id: int, after_id: Optional[int] = None, limit: Optional[int] = None):
     """
-    Retrieves all stock adjustment records for a given business,
+    Retrieves stock adjustment records for a given business, most recent first,
     eagerly loading the related product and user information.
+    The product is populated from the join already used for the business filter,
+    and any other relationship access raises instead of issuing a query per row.
+    Pages by keyset: `after_id` is the id of the last adjustment already shown; its
+    created_at is read back from the table so the comparison uses the stored value.
     """
-    return db.query(models.StockAdjustment)\
+    query = db.query(models.StockAdjustment)\
         .join(models.Product)\
         .join(models.Branch)\
         .filter(models.Branch.business_id == business_id)\
         .options(
-            joinedload(models.StockAdjustment.product),
-            joinedload(models.StockAdjustment.user)
-        )\
-        .order_by(desc(models.StockAdjustment.created_at))\
-        .all()
\ No newline at end of file
+            contains_eager(models.StockAdjustment.product),
+            joinedload(models.StockAdjustment.user),
+            raiseload('*')
+        )
+    if after_id is not None:
+        after_created_at = select(models.StockAdjustment.created_at)\
+            .where(models.StockAdjustment.id == after_id)\
+            .scalar_subquery()
+        query = query.filter(tuple_(models.StockAdjustment.created_at, models.StockAdjustment.id) < tuple_(after_created_at, after_id))
+    query = query.order_by(desc(models.StockAdjustment.created_at), desc(models.StockAdjustment.id))
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
\ No newline at end of file
@@ -1,35 +1,48 @@
 
-from sqlalchemy.orm import Session
-from sqlalchemy import desc
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy import desc, insert, tuple_
 from .. import models
+from .business import reserve_document_number
 from datetime import date
-from typing import List, Dict
+from decimal import Decimal, InvalidOperation
+from typing import List, Dict, Optional, Tuple
 
 
 
 def get_next_journal_voucher_number(db: Session, business_id: int) -> str:
-    """Calculates the next sequential journal voucher number for a given business."""
-    last_voucher = db.query(models.JournalVoucher.voucher_number)\
-        .filter(models.JournalVoucher.business_id == business_id)\
-        .order_by(desc(models.JournalVoucher.id))\
-        .first()
+    """Reserves the next sequential journal voucher number for a given business."""
+    return reserve_document_number(db, business_id, "JV", models.JournalVoucher.voucher_number)
 
-    if not last_voucher:
-        return "JV-0001"
-
-    last_num = int(last_voucher[0].split('-')[-1])
-    new_num = last_num + 1
-    return f"JV-{new_num:04d}"
+def _parse_amount(value) -> Decimal:
+    """Parses a debit/credit cell exactly as entered; blanks count as zero."""
+    try:
+        amount = Decimal(str(value or 0))
+    except InvalidOperation:
+        raise ValueError(f"Invalid amount: {value!r}")
+    if not amount.is_finite():
+        raise ValueError(f"Invalid amount: {value!r}")
+    return amount
 
 def create_journal_voucher(db: Session, business_id: int, branch_id: int, transaction_date: date, description: str, entries: List[Dict]):
     """
     Creates a new Journal Voucher and its associated, balanced ledger entries.
     """
-    total_debits = sum(float(e.get('debit', 0) or 0) for e in entries)
-    total_credits = sum(float(e.get('credit', 0) or 0) for e in entries)
+    # Parse every line once as Decimal, so the totals and the balance check are exact
+    lines = []
+    total_debits = Decimal(0)
+    total_credits = Decimal(0)
+    for entry_data in entries:
+        debit = _parse_amount(entry_data.get('debit'))
+        credit = _parse_amount(entry_data.get('credit'))
+        total_debits += debit
+        total_credits += credit
+
+        # Only create an entry if there's an amount
+        if debit > 0 or credit > 0:
+            lines.append((int(entry_data['account_id']), float(debit), float(credit)))
 
     # Crucial validation: Ensure the entry is balanced
-    if not (0.009 > total_debits - total_credits > -0.009): # Allow for minor floating point discrepancies
+    if total_debits != total_credits:
         raise ValueError(f"Journal entry is not balanced. Debits ({total_debits}) must equal Credits ({total_credits}).")
 
     # Create the parent voucher
@@ -43,31 +56,39 @@ def create_journal_voucher(db: Session, business_id: int, branch_id: int, transa
     db.add(new_voucher)
     db.flush() # To get the new_voucher.id
 
-    # Create each ledger entry line
-    for entry_data in entries:
-        debit = float(entry_data.get('debit', 0) or 0)
-        credit = float(entry_data.get('credit', 0) or 0)
-        
-        # Only create an entry if there's an amount
-        if debit > 0 or credit > 0:
-            db.add(models.LedgerEntry(
-                transaction_date=transaction_date,
-                description=description,
-                debit=debit,
-                credit=credit,
-                account_id=int(entry_data['account_id']),
-                branch_id=branch_id,
-                journal_voucher_id=new_voucher.id
-            ))
+    # Write the ledger entry lines with one executemany INSERT
+    ledger_rows = [
+        dict(
+            transaction_date=transaction_date,
+            description=description,
+            debit=debit,
+            credit=credit,
+            account_id=account_id,
+            branch_id=branch_id,
+            journal_voucher_id=new_voucher.id
+        )
+        for account_id, debit, credit in lines
+    ]
+    if ledger_rows:
+        db.execute(insert(models.LedgerEntry), ledger_rows)
     
     return new_voucher
 
-def get_journal_vouchers_by_branch(db: Session, business_id: int, branch_id: int):
-    """Retrieves all Journal Vouchers for a specific branch."""
-    return db.query(models.JournalVoucher)\
+def get_journal_vouchers_by_branch(db: Session, business_id: int, branch_id: int, after: Optional[Tuple[date, int]] = None, limit: Optional[int] = None):
+    """
+    Retrieves Journal Vouchers for a specific branch, most recent first,
+    with their ledger entries loaded in one extra IN query for the totals column.
+    Pages by keyset: `after` is the (transaction_date, id) of the last voucher already shown.
+    """
+    query = db.query(models.JournalVoucher)\
         .filter(
             models.JournalVoucher.business_id == business_id,
             models.JournalVoucher.branch_id == branch_id
         )\
-        .order_by(desc(models.JournalVoucher.transaction_date))\
-        .all()
+        .options(selectinload(models.JournalVoucher.ledger_entries))
+    if after is not None:
+        query = query.filter(tuple_(models.JournalVoucher.transaction_date, models.JournalVoucher.id) < tuple_(*after))
+    query = query.order_by(desc(models.JournalVoucher.transaction_date), desc(models.JournalVoucher.id))
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
@@ -1,11 +1,32 @@
 # app/crud/ledger.py
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import desc, asc, func
+from sqlalchemy.orm import Session, joinedload, contains_eager, raiseload
+from sqlalchemy import desc, asc, func, case, and_, insert, select
 from .. import models
-from typing import Optional
+from typing import NamedTuple, Optional
 from datetime import date
 from .. import crud
 
+class LedgerLine(NamedTuple):
+    """A ledger entry with the running balance after it; lighter than a dict per row."""
+    entry: models.LedgerEntry
+    balance: float
+
+def _control_account_ids(business_id: int, account_name: str):
+    """A SELECT of the business's account ids with the given name, for integer id comparisons."""
+    return select(models.Account.id).where(
+        models.Account.business_id == business_id,
+        models.Account.name == account_name
+    )
+
+def _running_balance(delta):
+    """
+    A window column summing `delta` over every row up to and including the current one,
+    in ledger order, so the database returns each entry's running balance.
+    """
+    return func.sum(delta).over(
+        order_by=(asc(models.LedgerEntry.transaction_date), asc(models.LedgerEntry.id))
+    )
+
 def get_vendor_ledger(db: Session, vendor_id: int, business_id: int):
     """
     Retrieves all ledger entries for a specific vendor and calculates a running balance.
@@ -14,21 +35,25 @@ def get_vendor_ledger(db: Session, vendor_id: int, business_id: int):
     if not vendor:
         return [], 0.0
 
-    entries = db.query(models.LedgerEntry)\
+    # Only Accounts Payable lines move the vendor's balance; the account is matched by id
+    delta = case(
+        (
+            models.LedgerEntry.account_id.in_(_control_account_ids(business_id, 'Accounts Payable')),
+            models.LedgerEntry.credit - models.LedgerEntry.debit
+        ),
+        else_=0.0
+    )
+    rows = db.query(models.LedgerEntry, _running_balance(delta))\
+        .join(models.LedgerEntry.account)\
+        .options(contains_eager(models.LedgerEntry.account))\
         .filter(models.LedgerEntry.vendor_id == vendor_id)\
         .order_by(asc(models.LedgerEntry.transaction_date), asc(models.LedgerEntry.id))\
         .all()
 
-    running_balance = 0
-    ledger_with_balance = []
-    for entry in entries:
-        if entry.account.name == 'Accounts Payable':
-            running_balance += entry.credit - entry.debit
-        
-        ledger_with_balance.append({
-            "entry": entry,
-            "balance": running_balance
-        })
+    # Dicts rather than LedgerLine: the vendor page runs these through jsonable_encoder,
+    # which would turn a tuple into a bare list
+    ledger_with_balance = [{"entry": entry, "balance": balance} for entry, balance in rows]
+    running_balance = ledger_with_balance[-1]["balance"] if ledger_with_balance else 0
 
     return ledger_with_balance, running_balance
 
@@ -41,21 +66,23 @@ def get_customer_ledger(db: Session, customer_id: int, business_id: int):
     if not customer:
         return [], 0.0
 
-    entries = db.query(models.LedgerEntry)\
+    # Only Accounts Receivable lines move the customer's balance; the account is matched by id
+    delta = case(
+        (
+            models.LedgerEntry.account_id.in_(_control_account_ids(business_id, 'Accounts Receivable')),
+            models.LedgerEntry.debit - models.LedgerEntry.credit
+        ),
+        else_=0.0
+    )
+    rows = db.query(models.LedgerEntry, _running_balance(delta))\
+        .join(models.LedgerEntry.account)\
+        .options(contains_eager(models.LedgerEntry.account))\
         .filter(models.LedgerEntry.customer_id == customer_id)\
         .order_by(asc(models.LedgerEntry.transaction_date), asc(models.LedgerEntry.id))\
         .all()
 
-    running_balance = 0
-    ledger_with_balance = []
-    for entry in entries:
-        if entry.account.name == 'Accounts Receivable':
-            running_balance += entry.debit - entry.credit
-        
-        ledger_with_balance.append({
-            "entry": entry,
-            "balance": running_balance
-        })
+    ledger_with_balance = [{"entry": entry, "balance": balance} for entry, balance in rows]
+    running_balance = ledger_with_balance[-1]["balance"] if ledger_with_balance else 0
 
     return ledger_with_balance, running_balance
 
@@ -65,17 +92,16 @@ def get_employee_ledger(db: Session, employee_id: int, business_id: int):
     """
     Retrieves all ledger entries related to an employee's payslips.
     """
-    employee = db.query(models.Employee).filter_by(id=employee_id, business_id=business_id).first()
-    if not employee:
-        return []
-
-    payslip_ids = [p.id for p in employee.payslips]
-
-    if not payslip_ids:
-        return []
+    # The employee's payslips, scoped to the business, stay in the database as a subquery
+    payslip_ids = select(models.Payslip.id).join(models.Employee).where(
+        models.Payslip.employee_id == employee_id,
+        models.Employee.business_id == business_id
+    )
 
+    # Only the account is loaded; touching any other relationship raises instead of lazy loading
     entries = db.query(models.LedgerEntry).options(
-        joinedload(models.LedgerEntry.account)
+        joinedload(models.LedgerEntry.account),
+        raiseload('*')
     ).filter(
         models.LedgerEntry.payslip_id.in_(payslip_ids)
     ).order_by(
@@ -89,13 +115,11 @@ def get_employee_ledger_summary(db: Session, employee_id: int, business_id: int)
     """
     Calculates summary KPIs for an employee's ledger history.
     """
-    payslips = db.query(models.Payslip).filter_by(employee_id=employee_id).all()
-    if not payslips:
-        return {"total_net_pay": 0, "total_paye": 0, "total_pension": 0}
-
-    total_net_pay = sum(p.net_pay for p in payslips)
-    total_paye = sum(p.paye_deduction for p in payslips)
-    total_pension = sum(p.pension_employee_deduction for p in payslips)
+    total_net_pay, total_paye, total_pension = db.query(
+        func.coalesce(func.sum(models.Payslip.net_pay), 0),
+        func.coalesce(func.sum(models.Payslip.paye_deduction), 0),
+        func.coalesce(func.sum(models.Payslip.pension_employee_deduction), 0)
+    ).filter(models.Payslip.employee_id == employee_id).one()
 
     return {
         "total_net_pay": total_net_pay,
@@ -120,15 +144,9 @@ def get_statutory_liability_ledger(db: Session, business_id: int, branch_id: int
         models.LedgerEntry.branch_id == branch_id # <-- FILTER ADDED
     ).order_by(models.LedgerEntry.transaction_date.desc()).all()
 
-    total_credits = db.query(func.sum(models.LedgerEntry.credit)).filter(
-        models.LedgerEntry.account_id == account.id,
-        models.LedgerEntry.branch_id == branch_id # <-- FILTER ADDED
-    ).scalar() or 0.0
-    
-    total_debits = db.query(func.sum(models.LedgerEntry.debit)).filter(
-        models.LedgerEntry.account_id == account.id,
-        models.LedgerEntry.branch_id == branch_id # <-- FILTER ADDED
-    ).scalar() or 0.0
+    # The entries above are the account's full history in the branch, so total them here
+    total_credits = sum((entry.credit or 0.0 for entry in entries), 0.0)
+    total_debits = sum((entry.debit or 0.0 for entry in entries), 0.0)
 
     balance = total_credits - total_debits
 
@@ -139,17 +157,19 @@ def get_cashbook(db: Session, business_id: int, branch_id: int, start_date: Opti
     Retrieves the cashbook for a specific branch and calculates a running balance.
     This is now enhanced to include all user-created bank accounts for the branch.
     """
-    # THE FIX: Instead of querying by name, we get the IDs of all valid payment accounts.
-    payment_accounts = crud.get_payment_accounts(db, business_id=business_id, branch_id=branch_id)
-    account_ids = [acc.id for acc in payment_accounts]
-
-    if not account_ids:
-        return [], 0.0
-
-    query = db.query(models.LedgerEntry).options(
-        joinedload(models.LedgerEntry.account)
+    # THE FIX: Instead of querying by name, we restrict to the IDs of all valid payment accounts.
+    # They are matched in a subquery, so the database resolves them as part of this query.
+    payment_account_ids = crud.select_payment_account_ids(business_id=business_id, branch_id=branch_id)
+
+    # The window runs after the WHERE clause, so the balance covers only the filtered entries
+    query = db.query(
+        models.LedgerEntry,
+        _running_balance(models.LedgerEntry.debit - models.LedgerEntry.credit)
+    ).options(
+        joinedload(models.LedgerEntry.account),
+        raiseload('*')
     ).filter(
-        models.LedgerEntry.account_id.in_(account_ids),
+        models.LedgerEntry.account_id.in_(payment_account_ids),
         models.LedgerEntry.branch_id == branch_id
     ).order_by(
         models.LedgerEntry.transaction_date.asc(),
@@ -161,24 +181,13 @@ def get_cashbook(db: Session, business_id: int, branch_id: int, start_date: Opti
     if end_date:
         query = query.filter(models.LedgerEntry.transaction_date <= end_date)
     
-    # If a specific account is selected for filtering, we use it.
+    # If a specific account is selected for filtering, we use it. An account_id that is not
+    # a valid payment account matches nothing, since the payment-account filter still applies.
     if account_id:
-        if account_id in account_ids:
-            query = query.filter(models.LedgerEntry.account_id == account_id)
-        else:
-            # If the provided account_id is not a valid payment account, return nothing.
-            return [], 0.0
-
-    entries = query.all()
+        query = query.filter(models.LedgerEntry.account_id == account_id)
 
-    running_balance = 0
-    ledger_with_balance = []
-    for entry in entries:
-        running_balance += entry.debit - entry.credit
-        ledger_with_balance.append({
-            "entry": entry,
-            "balance": running_balance
-        })
+    ledger_with_balance = [LedgerLine(entry, balance) for entry, balance in query.all()]
+    running_balance = ledger_with_balance[-1].balance if ledger_with_balance else 0
 
     return ledger_with_balance, running_balance
 
@@ -188,34 +197,44 @@ def get_profit_and_loss_data(db: Session, business_id: int, start_date: date, en
     Calculates totals for Revenue and Expense accounts for a P&L statement.
     Can be filtered by a specific branch.
     """
-    # **THE FIX IS HERE**: The nested function now accepts `branch_id`
-    def get_balance_for_accounts(accounts, date_filter, branch_id_to_filter: Optional[int] = None):
-        totals = {}
-        total_balance = 0.0
-        for acc in accounts:
-            query_base = db.query(
-                func.sum(models.LedgerEntry.credit - models.LedgerEntry.debit) if acc.type == models.AccountType.REVENUE else func.sum(models.LedgerEntry.debit - models.LedgerEntry.credit)
-            ).filter(
-                models.LedgerEntry.account_id == acc.id,
-                date_filter
-            )
-
-            if branch_id_to_filter:
-                query_base = query_base.filter(models.LedgerEntry.branch_id == branch_id_to_filter)
-            
-            balance = query_base.scalar() or 0.0
-            totals[acc.name] = balance
-            total_balance += balance
-        return totals, total_balance
-
-    date_filter = models.LedgerEntry.transaction_date.between(start_date, end_date)
-
-    revenue_accounts = db.query(models.Account).filter_by(business_id=business_id, type=models.AccountType.REVENUE).all()
-    expense_accounts = db.query(models.Account).filter_by(business_id=business_id, type=models.AccountType.EXPENSE).all()
-
-    # **THE FIX IS HERE**: Pass the `branch_id` down to the helper function
-    revenue_totals, total_revenue = get_balance_for_accounts(revenue_accounts, date_filter, branch_id_to_filter=branch_id)
-    expense_totals, total_expenses = get_balance_for_accounts(expense_accounts, date_filter, branch_id_to_filter=branch_id)
+    pnl_account_filter = and_(
+        models.Account.business_id == business_id,
+        models.Account.type.in_([models.AccountType.REVENUE, models.AccountType.EXPENSE])
+    )
+
+    # Total the period's entries per account once, with the date and branch filters
+    # applied a single time inside the CTE.
+    period_totals = select(
+        models.LedgerEntry.account_id,
+        func.sum(models.LedgerEntry.debit).label("debit"),
+        func.sum(models.LedgerEntry.credit).label("credit")
+    ).where(
+        models.LedgerEntry.transaction_date.between(start_date, end_date),
+        models.LedgerEntry.account_id.in_(select(models.Account.id).where(pnl_account_filter))
+    ).group_by(models.LedgerEntry.account_id)
+    if branch_id:
+        period_totals = period_totals.where(models.LedgerEntry.branch_id == branch_id)
+    period_totals = period_totals.cte("period_totals")
+
+    # Outer join so accounts without activity still come back, with a zero balance.
+    balance = case(
+        (models.Account.type == models.AccountType.REVENUE, period_totals.c.credit - period_totals.c.debit),
+        else_=period_totals.c.debit - period_totals.c.credit
+    )
+    rows = db.query(models.Account.name, models.Account.type, func.coalesce(balance, 0.0))\
+        .outerjoin(period_totals, period_totals.c.account_id == models.Account.id)\
+        .filter(pnl_account_filter)\
+        .order_by(models.Account.id)\
+        .all()
+
+    revenue_totals, expense_totals = {}, {}
+    total_revenue = 0.0
+    for name, account_type, account_balance in rows:
+        if account_type == models.AccountType.REVENUE:
+            revenue_totals[name] = account_balance
+            total_revenue += account_balance
+        else:
+            expense_totals[name] = account_balance
         
     cogs = expense_totals.pop("Cost of Goods Sold", 0.0)
     gross_profit = total_revenue - cogs
@@ -232,15 +251,19 @@ def get_profit_and_loss_data(db: Session, business_id: int, start_date: date, en
     }
 
 
-def get_general_ledger(db: Session, business_id: int, branch_id: int, start_date: Optional[date] = None, end_date: Optional[date] = None, account_id: Optional[int] = None):
+def get_general_ledger(db: Session, business_id: int, branch_id: int, start_date: Optional[date] = None, end_date: Optional[date] = None, account_id: Optional[int] = None, stream: bool = False):
     """
     Retrieves the general ledger for a specific branch, with optional filters.
+    With `stream=True` the entries come back as an iterator fetched in batches of 1000
+    (a server-side cursor where the driver supports one), so a multi-year ledger is never
+    held in memory at once; iterate it while the session is still open.
     """
     query = db.query(models.LedgerEntry).join(models.Account).filter(
         models.Account.business_id == business_id,
         models.LedgerEntry.branch_id == branch_id
     ).options(
-        joinedload(models.LedgerEntry.account)
+        joinedload(models.LedgerEntry.account),
+        raiseload('*')
     ).order_by(
         models.LedgerEntry.transaction_date.asc(),
         models.LedgerEntry.id.asc()
@@ -253,6 +276,8 @@ def get_general_ledger(db: Session, business_id: int, branch_id: int, start_date
     if account_id:
         query = query.filter(models.LedgerEntry.account_id == account_id)
 
+    if stream:
+        return query.yield_per(1000)
     return query.all()
 
 
@@ -265,34 +290,35 @@ def get_balance_sheet_data(db: Session, business_id: int, as_of_date: date, bran
     pnl_data = get_profit_and_loss_data(db, business_id, start_of_year, as_of_date, branch_id=branch_id)
     net_profit_for_period = pnl_data.get("net_profit", 0.0)
 
+    # The date and branch filters sit in the join condition so every account of the
+    # type comes back, even one without entries.
+    entry_filter = and_(
+        models.LedgerEntry.account_id == models.Account.id,
+        models.LedgerEntry.transaction_date <= as_of_date
+    )
+    if branch_id:
+        entry_filter = and_(entry_filter, models.LedgerEntry.branch_id == branch_id)
+
     def get_account_balances(account_type: models.AccountType):
-        accounts = db.query(models.Account).filter_by(business_id=business_id, type=account_type).all()
-        
+        rows = db.query(
+            models.Account.name,
+            func.coalesce(func.sum(models.LedgerEntry.debit), 0.0),
+            func.coalesce(func.sum(models.LedgerEntry.credit), 0.0)
+        ).outerjoin(models.LedgerEntry, entry_filter).filter(
+            models.Account.business_id == business_id,
+            models.Account.type == account_type
+        ).group_by(models.Account.id).order_by(models.Account.id).all()
+
         balances = {}
         total = 0.0
-        for acc in accounts:
-            debit_query = db.query(func.sum(models.LedgerEntry.debit)).filter(
-                models.LedgerEntry.account_id == acc.id,
-                models.LedgerEntry.transaction_date <= as_of_date
-            )
-            credit_query = db.query(func.sum(models.LedgerEntry.credit)).filter(
-                models.LedgerEntry.account_id == acc.id,
-                models.LedgerEntry.transaction_date <= as_of_date
-            )
-            if branch_id:
-                debit_query = debit_query.filter(models.LedgerEntry.branch_id == branch_id)
-                credit_query = credit_query.filter(models.LedgerEntry.branch_id == branch_id)
-
-            debit_sum = debit_query.scalar() or 0.0
-            credit_sum = credit_query.scalar() or 0.0
-            
+        for name, debit_sum, credit_sum in rows:
             if account_type in [models.AccountType.ASSET, models.AccountType.EXPENSE]:
                 balance = debit_sum - credit_sum
             else:
                 balance = credit_sum - debit_sum
 
             if balance != 0:
-                balances[acc.name] = balance
+                balances[name] = balance
                 total += balance
         return balances, total
 
@@ -314,12 +340,27 @@ def get_balance_sheet_data(db: Session, business_id: int, as_of_date: date, bran
     }
 
 
-def get_account_ledger(db: Session, account_id: int, branch_id: int, start_date: Optional[date] = None, end_date: Optional[date] = None):
+def _fetch_account_ledger(db: Session, columns, account_id: int, branch_id: int, start_date: Optional[date], end_date: Optional[date]):
     """
-    Retrieves all ledger entries for a single, specific account in a branch
-    and calculates a running balance.
+    Selects `columns` for an account's entries in a branch, followed by `opening_balance`
+    and the running `balance`, and returns (rows, opening_balance).
+    The opening balance rides along as a scalar subquery, so one query returns everything
+    whenever the period has entries.
     """
-    query = db.query(models.LedgerEntry).filter(
+    # Opening balance: everything on the account before the period starts
+    opening_balance_query = select(func.coalesce(func.sum(models.LedgerEntry.debit - models.LedgerEntry.credit), 0.0)).where(
+        models.LedgerEntry.account_id == account_id,
+        models.LedgerEntry.branch_id == branch_id
+    )
+    if start_date:
+        opening_balance_query = opening_balance_query.where(models.LedgerEntry.transaction_date < start_date)
+    opening_balance_column = opening_balance_query.scalar_subquery()
+
+    stmt = select(
+        *columns,
+        opening_balance_column.label("opening_balance"),
+        (opening_balance_column + _running_balance(models.LedgerEntry.debit - models.LedgerEntry.credit)).label("balance")
+    ).where(
         models.LedgerEntry.account_id == account_id,
         models.LedgerEntry.branch_id == branch_id
     ).order_by(
@@ -328,32 +369,42 @@ def get_account_ledger(db: Session, account_id: int, branch_id: int, start_date:
     )
 
     if start_date:
-        query = query.filter(models.LedgerEntry.transaction_date >= start_date)
+        stmt = stmt.where(models.LedgerEntry.transaction_date >= start_date)
     if end_date:
-        query = query.filter(models.LedgerEntry.transaction_date <= end_date)
+        stmt = stmt.where(models.LedgerEntry.transaction_date <= end_date)
 
-    entries = query.all()
+    rows = db.execute(stmt).all()
+    if not rows:
+        return rows, db.scalar(opening_balance_query)
+    return rows, rows[0].opening_balance
 
-    # Calculate opening balance
-    opening_balance_query = db.query(func.sum(models.LedgerEntry.debit - models.LedgerEntry.credit)).filter(
-        models.LedgerEntry.account_id == account_id,
-        models.LedgerEntry.branch_id == branch_id
-    )
-    if start_date:
-        opening_balance_query = opening_balance_query.filter(models.LedgerEntry.transaction_date < start_date)
-    
-    opening_balance = opening_balance_query.scalar() or 0.0
+def get_account_ledger(db: Session, account_id: int, branch_id: int, start_date: Optional[date] = None, end_date: Optional[date] = None):
+    """
+    Retrieves all ledger entries for a single, specific account in a branch
+    and calculates a running balance.
+    """
+    rows, opening_balance = _fetch_account_ledger(db, (models.LedgerEntry,), account_id, branch_id, start_date, end_date)
+    ledger_with_balance = [LedgerLine(row[0], row.balance) for row in rows]
+    closing_balance = ledger_with_balance[-1].balance if ledger_with_balance else opening_balance
+
+    return ledger_with_balance, opening_balance, closing_balance
 
-    running_balance = opening_balance
-    ledger_with_balance = []
-    for entry in entries:
-        running_balance += entry.debit - entry.credit
-        ledger_with_balance.append({
-            "entry": entry,
-            "balance": running_balance
-        })
+def get_account_ledger_rows(db: Session, account_id: int, branch_id: int, start_date: Optional[date] = None, end_date: Optional[date] = None):
+    """
+    Same ledger as get_account_ledger, but as plain rows of
+    (transaction_date, description, debit, credit, opening_balance, balance) with no ORM
+    entities, for exports that only print the columns.
+    """
+    columns = (
+        models.LedgerEntry.transaction_date,
+        models.LedgerEntry.description,
+        models.LedgerEntry.debit,
+        models.LedgerEntry.credit
+    )
+    rows, opening_balance = _fetch_account_ledger(db, columns, account_id, branch_id, start_date, end_date)
+    closing_balance = rows[-1].balance if rows else opening_balance
 
-    return ledger_with_balance, opening_balance, running_balance
+    return rows, opening_balance, closing_balance
 
 
 
@@ -380,22 +431,23 @@ def create_vat_payment_entry(db: Session, business_id: int, branch_id: int, paym
     db.add(new_voucher)
     db.flush()
 
-    # 1. Debit VAT Payable to clear the liability collected from sales
-    db.add(models.LedgerEntry(
-        transaction_date=payment_date, description=description, debit=output_vat_total,
-        account_id=output_vat_account.id, branch_id=branch_id, journal_voucher_id=new_voucher.id
-    ))
-
-    # 2. Credit VAT Receivable to clear the asset from purchases
-    db.add(models.LedgerEntry(
-        transaction_date=payment_date, description=description, credit=input_vat_total,
-        account_id=input_vat_account.id, branch_id=branch_id, journal_voucher_id=new_voucher.id
-    ))
-
-    # 3. Credit the Bank/Cash account for the actual amount paid out
-    db.add(models.LedgerEntry(
-        transaction_date=payment_date, description=description, credit=amount_paid,
-        account_id=payment_account_id, branch_id=branch_id, journal_voucher_id=new_voucher.id
-    ))
+    # All three lines go to the database in one executemany INSERT
+    db.execute(insert(models.LedgerEntry), [
+        # 1. Debit VAT Payable to clear the liability collected from sales
+        dict(
+            transaction_date=payment_date, description=description, debit=output_vat_total, credit=0.0,
+            account_id=output_vat_account.id, branch_id=branch_id, journal_voucher_id=new_voucher.id
+        ),
+        # 2. Credit VAT Receivable to clear the asset from purchases
+        dict(
+            transaction_date=payment_date, description=description, debit=0.0, credit=input_vat_total,
+            account_id=input_vat_account.id, branch_id=branch_id, journal_voucher_id=new_voucher.id
+        ),
+        # 3. Credit the Bank/Cash account for the actual amount paid out
+        dict(
+            transaction_date=payment_date, description=description, debit=0.0, credit=amount_paid,
+            account_id=payment_account_id, branch_id=branch_id, journal_voucher_id=new_voucher.id
+        ),
+    ])
 
     return new_voucher
\ No newline at end of file
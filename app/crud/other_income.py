@@ -1,22 +1,13 @@
 
 from sqlalchemy.orm import Session
-from sqlalchemy import desc
+from sqlalchemy import desc, insert
 from .. import models
+from .business import reserve_document_number
 from datetime import date
 
 def get_next_income_number(db: Session, business_id: int) -> str:
-    """Calculates the next sequential other income number."""
-    last_income = db.query(models.OtherIncome.income_number)\
-        .filter(models.OtherIncome.business_id == business_id)\
-        .order_by(desc(models.OtherIncome.id))\
-        .first()
-
-    if not last_income:
-        return "INC-0001"
-
-    last_num = int(last_income[0].split('-')[-1])
-    new_num = last_num + 1
-    return f"INC-{new_num:04d}"
+    """Reserves the next sequential other income number."""
+    return reserve_document_number(db, business_id, "INC", models.OtherIncome.income_number)
 
 def create_other_income(db: Session, income_data: dict, business_id: int, branch_id: int):
     """
@@ -36,25 +27,28 @@ def create_other_income(db: Session, income_data: dict, business_id: int, branch
     db.add(new_income)
     db.flush() # To get the new_income.id
 
-    # 1. Debit the asset account (Cash/Bank) that received the money
-    db.add(models.LedgerEntry(
-        transaction_date=new_income.income_date,
-        description=f"Other Income: {new_income.description}",
-        debit=new_income.amount,
-        account_id=new_income.deposited_to_account_id,
-        branch_id=branch_id,
-        other_income_id=new_income.id
-    ))
-
-    # 2. Credit the revenue account (e.g., "Interest Income")
-    db.add(models.LedgerEntry(
-        transaction_date=new_income.income_date,
-        description=f"Other Income: {new_income.description}",
-        credit=new_income.amount,
-        account_id=new_income.income_account_id,
-        branch_id=branch_id,
-        other_income_id=new_income.id
-    ))
+    db.execute(insert(models.LedgerEntry), [
+        # 1. Debit the asset account (Cash/Bank) that received the money
+        dict(
+            transaction_date=new_income.income_date,
+            description=f"Other Income: {new_income.description}",
+            debit=new_income.amount,
+            credit=0.0,
+            account_id=new_income.deposited_to_account_id,
+            branch_id=branch_id,
+            other_income_id=new_income.id
+        ),
+        # 2. Credit the revenue account (e.g., "Interest Income")
+        dict(
+            transaction_date=new_income.income_date,
+            description=f"Other Income: {new_income.description}",
+            debit=0.0,
+            credit=new_income.amount,
+            account_id=new_income.income_account_id,
+            branch_id=branch_id,
+            other_income_id=new_income.id
+        ),
+    ])
     
     return new_income
 
@@ -1,7 +1,12 @@
 
 from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import select
 from .. import models, schemas
-from typing import Set, List
+from typing import Set, List, Optional, FrozenSet, Tuple
+import time
+
+PERMISSION_NAMES_CACHE_TTL = 60
+_permission_names_cache: Optional[Tuple[float, FrozenSet[str]]] = None
 
 def get_all_permissions(db: Session):
     return db.query(models.Permission).order_by(models.Permission.category, models.Permission.name).all()
@@ -9,7 +14,19 @@ def get_all_permissions(db: Session):
 def get_all_permission_names(db: Session) -> Set[str]: # <-- NEW FUNCTION
     """
     Efficiently fetches the names of all defined permissions.
+    The permission table only changes when it is seeded, so the names are served
+    from a per-process cache for up to PERMISSION_NAMES_CACHE_TTL seconds.
     """
-    return {p.name for p in db.query(models.Permission.name).all()}
+    global _permission_names_cache
+    cached = _permission_names_cache
+    if cached is None or cached[0] <= time.monotonic():
+        names = frozenset(db.scalars(select(models.Permission.name)))
+        cached = _permission_names_cache = (time.monotonic() + PERMISSION_NAMES_CACHE_TTL, names)
+    return set(cached[1])
+
+def invalidate_permission_names() -> None:
+    """Drops the cached permission names after the permission table changes."""
+    global _permission_names_cache
+    _permission_names_cache = None
 
 
@@ -1,46 +1,77 @@
 
 
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func, desc
+from sqlalchemy.orm import Session, joinedload, selectinload
+from sqlalchemy import func, desc, insert, update, case, tuple_, or_, select
 from .. import models, schemas
+from .business import peek_document_number, reserve_document_number, reserve_document_numbers
+from collections import defaultdict
 from datetime import date
+from typing import Dict, List, Optional, Tuple
 from .. import crud
 
 
 
 def get_next_purchase_bill_number(db: Session, business_id: int) -> str:
     """
-    Calculates the next sequential purchase bill number for a given business.
+    Reserves the next sequential purchase bill number for a given business.
     Example: If the last bill is 'PB-0003', this returns 'PB-0004'.
     """
+    return reserve_document_number(db, business_id, "PB", models.PurchaseBill.bill_number)
 
-    last_bill = db.query(models.PurchaseBill.bill_number)\
-        .filter(models.PurchaseBill.business_id == business_id)\
-        .order_by(desc(models.PurchaseBill.id))\
-        .first()
-
-    if not last_bill:
+def peek_next_purchase_bill_number(db: Session, business_id: int) -> str:
+    """
+    Shows the purchase bill number the next bill is expected to get, without reserving it.
+    Used by the preview page; the number is reserved only when the bill is saved.
+    """
+    return peek_document_number(db, business_id, "PB", models.PurchaseBill.bill_number)
 
-        return "PB-0001"
 
+PURCHASE_ACCOUNT_NAMES = ("Inventory", "Accounts Payable", "VAT Receivable (Input VAT)")
 
-    last_number_str = last_bill[0].split('-')[-1]
-    next_number = int(last_number_str) + 1
-    return f"PB-{next_number:04d}"
+def get_purchase_account_ids(db: Session, business_id: int) -> Dict[str, int]:
+    """
+    Fetches the ids of the accounts purchases post to in a single query, keyed by name.
+    Missing accounts are simply absent; callers decide which ones they need.
+    Memoized in `db.info` like get_business, so every bill, payment and debit note
+    posted in the same session shares one lookup; plain ids stay valid across commits.
+    """
+    purchase_accounts = db.info.setdefault("purchase_account_ids", {})
+    if business_id not in purchase_accounts:
+        rows = db.query(models.Account.name, models.Account.id).filter(
+            models.Account.business_id == business_id,
+            models.Account.name.in_(PURCHASE_ACCOUNT_NAMES)
+        ).all()
+        purchase_accounts[business_id] = {name: account_id for name, account_id in rows}
+    return purchase_accounts[business_id]
 
 
-def get_purchase_bills_by_business(db: Session, business_id: int, branch_id: int, skip: int = 0, limit: int = 100):
+def get_purchase_bills_by_business(db: Session, business_id: int, branch_id: int, after: Optional[Tuple[date, int]] = None, limit: int = 100, search: Optional[str] = None):
     """
     Retrieves all purchase bills for a specific business, ordered by the most recent.
     It also preloads the vendor information to avoid extra database queries.
+    Pages by keyset: `after` is the (bill_date, id) of the last bill already shown.
+    `search` matches the bill number or vendor name across the whole history.
     """
-    return db.query(models.PurchaseBill)\
+    query = db.query(models.PurchaseBill)\
         .filter(models.PurchaseBill.business_id == business_id,
             models.PurchaseBill.branch_id == branch_id
-            )\
+            )
+    if search:
+        pattern = f"%{search}%"
+        query = query.filter(or_(
+            models.PurchaseBill.bill_number.ilike(pattern),
+            models.PurchaseBill.vendor_id.in_(
+                select(models.Vendor.id).where(
+                    models.Vendor.business_id == business_id,
+                    models.Vendor.name.ilike(pattern)
+                )
+            )
+        ))
+    if after is not None:
+        query = query.filter(tuple_(models.PurchaseBill.bill_date, models.PurchaseBill.id) < tuple_(*after))
+    return query\
         .options(joinedload(models.PurchaseBill.vendor))\
         .order_by(desc(models.PurchaseBill.bill_date), desc(models.PurchaseBill.id))\
-        .offset(skip)\
         .limit(limit)\
         .all()
         
@@ -51,7 +82,7 @@ def get_purchase_bill(db: Session, bill_id: int, business_id: int):
     """
     return db.query(models.PurchaseBill).options(
         joinedload(models.PurchaseBill.vendor),
-        joinedload(models.PurchaseBill.items).joinedload(models.PurchaseBillItem.product)
+        selectinload(models.PurchaseBill.items).joinedload(models.PurchaseBillItem.product)
     ).filter(
         models.PurchaseBill.id == bill_id,
         models.PurchaseBill.business_id == business_id
@@ -73,17 +104,8 @@ def get_purchase_bills_by_vendor(db: Session, vendor_id: int, business_id: int):
 
 
 def get_next_debit_note_number(db: Session, business_id: int) -> str:
-    last_note = db.query(models.DebitNote)\
-        .filter(models.DebitNote.business_id == business_id)\
-        .order_by(models.DebitNote.id.desc())\
-        .first()
-    
-    if not last_note:
-        return "DN-0001"
-    
-    last_num = int(last_note.debit_note_number.split('-')[1])
-    new_num = last_num + 1
-    return f"DN-{new_num:04d}"
+    """Reserves the next sequential debit note number for a given business."""
+    return reserve_document_number(db, business_id, "DN", models.DebitNote.debit_note_number)
 
 
 
@@ -102,7 +124,7 @@ def get_debit_notes_by_business(db: Session, business_id: int):
 
 def create_purchase_bill(db: Session, bill_data: schemas.PurchaseBillCreate, business_id: int, branch_id: int):
     """Creates a new purchase bill and the correct, branch-aware ledger entries, including VAT."""
-    business = db.query(models.Business).filter(models.Business.id == business_id).first()
+    business = crud.business.get_business(db, business_id)
     if not business:
         raise ValueError("Business not found.")
         
@@ -113,13 +135,14 @@ def create_purchase_bill(db: Session, bill_data: schemas.PurchaseBillCreate, bus
     if vendor.branch_id != branch_id:
         pass
 
-    inventory_account = db.query(models.Account).filter_by(business_id=business_id, name="Inventory").first()
-    ap_account = db.query(models.Account).filter_by(business_id=business_id, name="Accounts Payable").first()
-    vat_account = db.query(models.Account).filter_by(business_id=business_id, name="VAT Receivable (Input VAT)").first()
+    account_ids = get_purchase_account_ids(db, business_id)
+    inventory_account_id = account_ids.get("Inventory")
+    ap_account_id = account_ids.get("Accounts Payable")
+    vat_account_id = account_ids.get("VAT Receivable (Input VAT)")
 
-    if not ap_account or not inventory_account:
+    if not ap_account_id or not inventory_account_id:
         raise ValueError("Core accounting accounts (Accounts Payable or Inventory) not found.")
-    if business.is_vat_registered and not vat_account:
+    if business.is_vat_registered and not vat_account_id:
         raise ValueError("VAT Receivable account not found.")
 
     sub_total = sum(item.quantity * item.price for item in bill_data.items)
@@ -140,45 +163,140 @@ def create_purchase_bill(db: Session, bill_data: schemas.PurchaseBillCreate, bus
     )
     db.add(db_bill)
     db.flush()
-    for item_data in bill_data.items:
-        db.add(models.PurchaseBillItem(
+
+    # All line items go to the database in one executemany INSERT
+    db.execute(insert(models.PurchaseBillItem), [
+        dict(
             purchase_bill_id=db_bill.id,
             product_id=item_data.product_id,
             quantity=item_data.quantity,
             price=item_data.price
-        ))
-        # **THE FIX**: Call the function through the imported crud namespace
-        product = crud.inventory.get_product_by_id(db, product_id=item_data.product_id)
-        if product:
-            product.stock_quantity += item_data.quantity
+        ) for item_data in bill_data.items
+    ])
+    # Raise stock for every product on the bill with one UPDATE
+    stock_deltas = defaultdict(float)
+    for item_data in bill_data.items:
+        stock_deltas[item_data.product_id] += item_data.quantity
+    crud.inventory.adjust_stock_quantities(db, stock_deltas)
 
     # --- UPDATED ACCOUNTING ENTRIES ---
     # 1. Debit Inventory for the NET amount
-    db.add(models.LedgerEntry(
-        account_id=inventory_account.id, transaction_date=db_bill.bill_date, debit=sub_total,
+    ledger_rows = [dict(
+        account_id=inventory_account_id, transaction_date=db_bill.bill_date, debit=sub_total, credit=0.0,
         description=f"Inventory from Bill #{db_bill.bill_number}",
         vendor_id=bill_data.vendor_id, purchase_bill_id=db_bill.id, branch_id=branch_id
-    ))
+    )]
     # 2. Debit VAT Receivable for the VAT amount
     if business.is_vat_registered and vat_amount > 0:
-        db.add(models.LedgerEntry(
-            account_id=vat_account.id, transaction_date=db_bill.bill_date, debit=vat_amount,
+        ledger_rows.append(dict(
+            account_id=vat_account_id, transaction_date=db_bill.bill_date, debit=vat_amount, credit=0.0,
             description=f"Input VAT on Bill #{db_bill.bill_number}",
             vendor_id=bill_data.vendor_id, purchase_bill_id=db_bill.id, branch_id=branch_id
         ))
     # 3. Credit Accounts Payable for the FULL amount
-    db.add(models.LedgerEntry(
-        account_id=ap_account.id, transaction_date=db_bill.bill_date, credit=total_amount,
+    ledger_rows.append(dict(
+        account_id=ap_account_id, transaction_date=db_bill.bill_date, debit=0.0, credit=total_amount,
         description=f"Liability for Bill #{db_bill.bill_number}",
         vendor_id=bill_data.vendor_id, purchase_bill_id=db_bill.id, branch_id=branch_id
     ))
+    db.execute(insert(models.LedgerEntry), ledger_rows)
     
     return db_bill
 
+def create_purchase_bills(db: Session, bills: List[schemas.PurchaseBillCreate], business_id: int, branch_id: int) -> List[int]:
+    """
+    Creates many purchase bills at once for imports, with the same amounts and ledger
+    postings as create_purchase_bill. Accounts and vendors are checked once, the bill
+    numbers are reserved as one block, bills, items and ledger lines each go in with a
+    single executemany INSERT, and stock is raised with one UPDATE.
+    Returns the new bill ids in input order. DOES NOT COMMIT.
+    """
+    if not bills:
+        return []
+
+    business = crud.business.get_business(db, business_id)
+    if not business:
+        raise ValueError("Business not found.")
+
+    vendor_ids = {bill_data.vendor_id for bill_data in bills}
+    found_vendor_ids = {vendor_id for vendor_id, in db.query(models.Vendor.id).filter(
+        models.Vendor.business_id == business_id,
+        models.Vendor.id.in_(vendor_ids)
+    )}
+    if found_vendor_ids != vendor_ids:
+        raise ValueError("Vendor not found.")
+
+    account_ids = get_purchase_account_ids(db, business_id)
+    inventory_account_id = account_ids.get("Inventory")
+    ap_account_id = account_ids.get("Accounts Payable")
+    vat_account_id = account_ids.get("VAT Receivable (Input VAT)")
+
+    if not ap_account_id or not inventory_account_id:
+        raise ValueError("Core accounting accounts (Accounts Payable or Inventory) not found.")
+    if business.is_vat_registered and not vat_account_id:
+        raise ValueError("VAT Receivable account not found.")
+
+    bill_numbers = reserve_document_numbers(db, business_id, "PB", models.PurchaseBill.bill_number, len(bills))
+    bill_rows = []
+    for bill_data, bill_number in zip(bills, bill_numbers):
+        sub_total = sum(item.quantity * item.price for item in bill_data.items)
+        vat_amount = bill_data.vat_amount if business.is_vat_registered else 0
+        bill_rows.append(dict(
+            bill_number=bill_number,
+            vendor_id=bill_data.vendor_id,
+            bill_date=bill_data.bill_date,
+            due_date=bill_data.due_date,
+            sub_total=sub_total,
+            vat_amount=vat_amount,
+            total_amount=sub_total + vat_amount,
+            branch_id=branch_id,
+            business_id=business_id
+        ))
+    bill_ids = db.scalars(
+        insert(models.PurchaseBill).returning(models.PurchaseBill.id, sort_by_parameter_order=True),
+        bill_rows
+    ).all()
+
+    item_rows = []
+    ledger_rows = []
+    stock_deltas = defaultdict(float)
+    for bill_data, bill_row, bill_id in zip(bills, bill_rows, bill_ids):
+        for item_data in bill_data.items:
+            item_rows.append(dict(
+                purchase_bill_id=bill_id,
+                product_id=item_data.product_id,
+                quantity=item_data.quantity,
+                price=item_data.price
+            ))
+            stock_deltas[item_data.product_id] += item_data.quantity
+
+        bill_number = bill_row["bill_number"]
+        posting = dict(transaction_date=bill_row["bill_date"], vendor_id=bill_row["vendor_id"], purchase_bill_id=bill_id, branch_id=branch_id)
+        ledger_rows.append(dict(
+            posting, account_id=inventory_account_id, debit=bill_row["sub_total"], credit=0.0,
+            description=f"Inventory from Bill #{bill_number}"
+        ))
+        if business.is_vat_registered and bill_row["vat_amount"] > 0:
+            ledger_rows.append(dict(
+                posting, account_id=vat_account_id, debit=bill_row["vat_amount"], credit=0.0,
+                description=f"Input VAT on Bill #{bill_number}"
+            ))
+        ledger_rows.append(dict(
+            posting, account_id=ap_account_id, debit=0.0, credit=bill_row["total_amount"],
+            description=f"Liability for Bill #{bill_number}"
+        ))
+
+    if item_rows:
+        db.execute(insert(models.PurchaseBillItem), item_rows)
+    db.execute(insert(models.LedgerEntry), ledger_rows)
+    crud.inventory.adjust_stock_quantities(db, stock_deltas)
+
+    return bill_ids
+
 def record_payment_for_bill(db: Session, bill: models.PurchaseBill, payment_date: date, amount_paid: float, payment_account_id: int):
     """Records a payment against a purchase bill and creates branch-aware ledger entries."""
-    ap_account = db.query(models.Account).filter_by(business_id=bill.business_id, name="Accounts Payable").first()
-    if not ap_account:
+    ap_account_id = get_purchase_account_ids(db, bill.business_id).get("Accounts Payable")
+    if not ap_account_id:
         raise ValueError("Critical error: Accounts Payable account not found.")
 
     bill.paid_amount += amount_paid
@@ -190,7 +308,7 @@ def record_payment_for_bill(db: Session, bill: models.PurchaseBill, payment_date
     branch_id = bill.branch_id
     
     db.add(models.LedgerEntry(
-        account_id=ap_account.id, transaction_date=payment_date, debit=amount_paid,
+        account_id=ap_account_id, transaction_date=payment_date, debit=amount_paid,
         description=f"Payment for Bill #{bill.bill_number}",
         vendor_id=bill.vendor_id, purchase_bill_id=bill.id, branch_id=branch_id
     ))
@@ -207,9 +325,10 @@ def create_debit_note_for_bill(db: Session, original_bill: models.PurchaseBill,
 
     total_return_value = sum(item['quantity'] * item['price'] for item in items_to_return)
     
-    ap_account = db.query(models.Account).filter_by(business_id=original_bill.business_id, name="Accounts Payable").first()
-    inventory_account = db.query(models.Account).filter_by(business_id=original_bill.business_id, name="Inventory").first()
-    if not ap_account or not inventory_account:
+    account_ids = get_purchase_account_ids(db, original_bill.business_id)
+    ap_account_id = account_ids.get("Accounts Payable")
+    inventory_account_id = account_ids.get("Inventory")
+    if not ap_account_id or not inventory_account_id:
         raise ValueError("Critical accounting accounts are not configured.")
 
     branch_id = original_bill.branch_id
@@ -226,20 +345,27 @@ def create_debit_note_for_bill(db: Session, original_bill: models.PurchaseBill,
     db.add(debit_note)
     db.flush()
 
-    for item_data in items_to_return:
-        db.add(models.DebitNoteItem(
+    db.execute(insert(models.DebitNoteItem), [
+        dict(
             debit_note_id=debit_note.id,
             product_id=item_data['product_id'],
             quantity=item_data['quantity'],
             price=item_data['price']
-        ))
-
-        product = crud.inventory.get_product_by_id(db, product_id=item_data['product_id'])
-        if product:
-            product.stock_quantity -= item_data['quantity']
-        db_bill_item = db.query(models.PurchaseBillItem).filter_by(id=item_data['original_item_id']).with_for_update().first()
-        if db_bill_item:
-            db_bill_item.returned_quantity += item_data['quantity']
+        ) for item_data in items_to_return
+    ])
+    # Lower stock and record the returned quantities with one UPDATE each; both add in SQL,
+    # so concurrent returns against the same bill cannot lose an update
+    stock_deltas = defaultdict(float)
+    returned_quantities = defaultdict(float)
+    for item_data in items_to_return:
+        stock_deltas[item_data['product_id']] -= item_data['quantity']
+        returned_quantities[item_data['original_item_id']] += item_data['quantity']
+    crud.inventory.adjust_stock_quantities(db, stock_deltas)
+    db.execute(
+        update(models.PurchaseBillItem)
+        .where(models.PurchaseBillItem.id.in_(returned_quantities))
+        .values(returned_quantity=func.coalesce(models.PurchaseBillItem.returned_quantity, 0.0) + case(returned_quantities, value=models.PurchaseBillItem.id))
+    )
 
     original_bill.total_amount -= total_return_value
     if original_bill.total_amount <= original_bill.paid_amount + 0.001:
@@ -249,15 +375,17 @@ def create_debit_note_for_bill(db: Session, original_bill: models.PurchaseBill,
     else:
         original_bill.status = "Unpaid"
 
-    db.add(models.LedgerEntry(
-        account_id=ap_account.id, transaction_date=debit_note.debit_note_date, debit=total_return_value,
-        description=f"Return on DN #{debit_note.debit_note_number}",
-        vendor_id=original_bill.vendor_id, debit_note_id=debit_note.id, branch_id=branch_id
-    ))
-    db.add(models.LedgerEntry(
-        account_id=inventory_account.id, transaction_date=debit_note.debit_note_date, credit=total_return_value,
-        description=f"Return on DN #{debit_note.debit_note_number}",
-        vendor_id=original_bill.vendor_id, debit_note_id=debit_note.id, branch_id=branch_id
-    ))
+    db.execute(insert(models.LedgerEntry), [
+        dict(
+            account_id=ap_account_id, transaction_date=debit_note.debit_note_date, debit=total_return_value, credit=0.0,
+            description=f"Return on DN #{debit_note.debit_note_number}",
+            vendor_id=original_bill.vendor_id, debit_note_id=debit_note.id, branch_id=branch_id
+        ),
+        dict(
+            account_id=inventory_account_id, transaction_date=debit_note.debit_note_date, debit=0.0, credit=total_return_value,
+            description=f"Return on DN #{debit_note.debit_note_number}",
+            vendor_id=original_bill.vendor_id, debit_note_id=debit_note.id, branch_id=branch_id
+        ),
+    ])
     
-    return debit_note
\ No newline at end of file
+    return debit_note
\ No newline at end of file
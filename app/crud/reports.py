@@ -522,18 +522,14 @@ def get_account_statement_data(db: Session, business_id: int, start_date: date,
         models.LedgerEntry.transaction_date.between(start_date, end_date)
     ).order_by(models.LedgerEntry.transaction_date.asc(), models.LedgerEntry.id.asc()).all()
 
+    # Customers owe debit - credit and vendors are owed credit - debit; pick the sign once
+    sign = 1.0 if customer_id else -1.0
     running_balance = opening_balance
     statement_lines = []
+    append_line = statement_lines.append
     for entry in entries:
-        if customer_id:
-            running_balance += entry.debit - entry.credit
-        else:
-            running_balance += entry.credit - entry.debit
-        
-        statement_lines.append({
-            "entry": entry,
-            "balance": running_balance
-        })
+        running_balance += sign * (entry.debit - entry.credit)
+        append_line({"entry": entry, "balance": running_balance})
 
     return statement_lines, opening_balance, running_balance, target
 
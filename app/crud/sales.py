@@ -50,7 +50,7 @@ def get_sales_invoices_by_customer(db: Session, customer_id: int, business_id: i
 
 def create_sales_invoice(db: Session, invoice_data: schemas.SalesInvoiceCreate, business_id: int, branch_id: int):
     """Creates a new sales invoice and the correct, branch-aware ledger entries, including VAT if applicable."""
-    business = db.query(models.Business).filter(models.Business.id == business_id).first()
+    business = crud.business.get_business(db, business_id)
     if not business:
         raise ValueError("Business not found.")
 
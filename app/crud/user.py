@@ -1,5 +1,5 @@
 
-from sqlalchemy.orm import Session, subqueryload, joinedload
+from sqlalchemy.orm import Session, selectinload, joinedload
 from typing import Set
 from .. import models, schemas, security, crud 
 
@@ -96,9 +96,9 @@ def get_user_with_relations(db: Session, username: str):
         .filter(models.User.username == username)
         .options(
             joinedload(models.User.business),
-            subqueryload(models.User.roles)
+            selectinload(models.User.roles)
             .joinedload(models.UserBranchRole.role)
-            .subqueryload(models.Role.permissions)
+            .selectinload(models.Role.permissions)
             .joinedload(models.RolePermission.permission),
         )
         .first()
@@ -1,13 +1,36 @@
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
 
 DATABASE_URL = "sqlite:///./saas.db"
 
-engine = create_engine(
-    DATABASE_URL, connect_args={"check_same_thread": False}
-)
+engine_options = {}
+database_url = make_url(DATABASE_URL)
+if database_url.get_backend_name() == "sqlite":
+    engine_options["connect_args"] = {"check_same_thread": False}
+else:
+    # Keep warm server connections across requests; LIFO reuse lets idle extras time out,
+    # and pre-ping/recycle drop connections the server or a proxy has closed.
+    engine_options.update(
+        pool_size=10,
+        max_overflow=20,
+        pool_pre_ping=True,
+        pool_recycle=1800,
+        pool_use_lifo=True,
+    )
+    if database_url.get_driver_name() == "psycopg2":
+        # SQLAlchemy already sends executemany INSERTs (ledger lines, payslip items) as
+        # multi-row VALUES; this sets their page size and also pages other executemany
+        # statements, such as bulk UPDATEs, through psycopg2's execute_batch.
+        engine_options.update(
+            executemany_mode="values_plus_batch",
+            insertmanyvalues_page_size=1000,
+            executemany_batch_page_size=500,
+        )
+
+engine = create_engine(DATABASE_URL, **engine_options)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
@@ -17,9 +40,29 @@ Base = declarative_base()
 def init_db():
     from . import models
     Base.metadata.create_all(bind=engine)
+    upgrade_schema()
     print("Database tables created.")
 
 
+def upgrade_schema(bind=engine):
+    """
+    Adds columns and indexes that newer models expect to tables created by older releases.
+    create_all only creates missing tables, so existing ones are patched here.
+    """
+    from . import models
+    with bind.begin() as conn:
+        product_columns = {column["name"] for column in inspect(conn).get_columns("products")}
+        if "business_id" not in product_columns:
+            conn.execute(text("ALTER TABLE products ADD COLUMN business_id INTEGER REFERENCES businesses(id)"))
+            conn.execute(text(
+                "UPDATE products SET business_id = "
+                "(SELECT branches.business_id FROM branches WHERE branches.id = products.branch_id)"
+            ))
+        for table in models.Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
+
+
 def get_db():
     db = SessionLocal()
     try:
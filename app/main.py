@@ -5,7 +5,7 @@ from fastapi.staticfiles import StaticFiles
 from sqlalchemy.orm import Session, registry
 from jose import JWTError, jwt
 
-from .database import engine, Base, get_db
+from .database import engine, Base, get_db, upgrade_schema
 from . import models
 registry().configure()
 
@@ -15,6 +15,7 @@ from .routers import auth, settings_business,  dashboard, branches, customers, t
 
 
 Base.metadata.create_all(bind=engine)
+upgrade_schema()
 
 app = FastAPI()
 
@@ -86,6 +87,7 @@ def seed_permissions():
             if perm_data["name"] not in existing_perm_names:
                 db.add(models.Permission(**perm_data))
         db.commit()
+        crud.invalidate_permission_names()
         print(f"--- {len(all_permissions) - len(existing_perm_names)} new permissions have been seeded. ---")
     else:
         print("--- Permissions already exist, skipping seed. ---")
@@ -1,5 +1,5 @@
 # app/models.py
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, DateTime, func, Float, Text, UniqueConstraint, Date
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, DateTime, func, Float, Text, UniqueConstraint, Date, Index
 from sqlalchemy.orm import relationship
 from .database import Base
 from sqlalchemy import Enum as SQLAlchemyEnum
@@ -81,6 +81,10 @@ class Account(Base):
 
     bank_account_details = relationship("BankAccount", back_populates="chart_of_account", uselist=False, cascade="all, delete-orphan")
 
+    __table_args__ = (
+        # Posting code looks up a business's system accounts by name.
+        Index('ix_accounts_business_name', 'business_id', 'name'),
+    )
 
 
 class DebitNote(Base):
@@ -98,6 +102,11 @@ class DebitNote(Base):
     
     items = relationship("DebitNoteItem", back_populates="debit_note", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        # Serves the business's debit note list newest-first.
+        Index('ix_debit_notes_business_date', 'business_id', 'debit_note_date', 'id'),
+    )
+
 class DebitNoteItem(Base):
     __tablename__ = "debit_note_items"
     id = Column(Integer, primary_key=True)
@@ -124,6 +133,10 @@ class JournalVoucher(Base):
     
     ledger_entries = relationship("LedgerEntry", back_populates="journal_voucher")
 
+    __table_args__ = (
+        Index('ix_journal_vouchers_business_branch_date', 'business_id', 'branch_id', 'transaction_date', 'id'),
+    )
+
 class LedgerEntry(Base):
     __tablename__ = "ledger_entries"
     id = Column(Integer, primary_key=True)
@@ -171,6 +184,24 @@ class LedgerEntry(Base):
     reconciliation_id = Column(Integer, ForeignKey("bank_reconciliations.id"), nullable=True)
     reconciliation = relationship("BankReconciliation", back_populates="ledger_entries")
 
+    __table_args__ = (
+        # Business-wide reports (P&L, balance sheet, analytics) filter accounts by a date
+        # range with no branch, so the date has to follow the account directly.
+        Index('ix_ledger_entries_account_date_branch', 'account_id', 'transaction_date', 'branch_id'),
+        # Branch-scoped reads (account ledgers, cashbook, budgets, VAT) seek one account in a
+        # branch and walk it in (date, id) order.
+        Index('ix_ledger_entries_account_branch_date', 'account_id', 'branch_id', 'transaction_date', 'id'),
+        # Reconciliation: the reconciled-balance SUM is answered from this index alone, and an
+        # account's unreconciled entries for a branch come back in date order.
+        Index(
+            'ix_ledger_entries_account_reconciled', 'account_id', 'is_reconciled', 'branch_id',
+            'transaction_date', 'debit', 'credit'
+        ),
+        # Vendor and customer ledgers walk a party's entries in (date, id) order.
+        Index('ix_ledger_entries_vendor_date', 'vendor_id', 'transaction_date', 'id'),
+        Index('ix_ledger_entries_customer_date', 'customer_id', 'transaction_date', 'id'),
+    )
+
 
 
 class Customer(Base):
@@ -190,6 +221,11 @@ class Customer(Base):
     sales_invoices = relationship("SalesInvoice", back_populates="customer")
     credit_notes = relationship("CreditNote", back_populates="customer")
 
+    __table_args__ = (
+        # Serves the branch customer list in (name, id) order for keyset paging.
+        Index('ix_customers_business_branch_name', 'business_id', 'branch_id', 'name', 'id'),
+    )
+
 
 class Vendor(Base):
     __tablename__ = "vendors"
@@ -265,10 +301,16 @@ class Product(Base):
 
     branch_id = Column(Integer, ForeignKey("branches.id"))
     branch = relationship("Branch", back_populates="products")
+    # Copied from the branch on create so business-wide product lists skip the join through branches
+    business_id = Column(Integer, ForeignKey("businesses.id"))
     category_id = Column(Integer, ForeignKey("categories.id"))
     category = relationship("Category", back_populates="products")
     stock_adjustments = relationship("StockAdjustment", back_populates="product")
 
+    __table_args__ = (
+        Index('ix_products_business_name', 'business_id', 'name'),
+    )
+
 class StockAdjustment(Base):
     __tablename__ = "stock_adjustments"
     id = Column(Integer, primary_key=True)
@@ -280,6 +322,10 @@ class StockAdjustment(Base):
     user_id = Column(Integer, ForeignKey("users.id"))
     user = relationship("User")
 
+    __table_args__ = (
+        Index('ix_stock_adjustments_created_at', 'created_at'),
+    )
+
 class PurchaseBill(Base):
     __tablename__ = "purchase_bills"
     id = Column(Integer, primary_key=True)
@@ -304,6 +350,8 @@ class PurchaseBill(Base):
     items = relationship("PurchaseBillItem", back_populates="purchase_bill", cascade="all, delete-orphan")
     __table_args__ = (
         UniqueConstraint('business_id', 'bill_number', name='_business_bill_number_uc'),
+        # Serves the branch bill history newest-first; the planner walks it backwards.
+        Index('ix_purchase_bills_business_branch_date', 'business_id', 'branch_id', 'bill_date', 'id'),
     )
 
 class PurchaseBillItem(Base):
@@ -346,6 +394,7 @@ class SalesInvoice(Base):
     
     __table_args__ = (
         UniqueConstraint('business_id', 'invoice_number', name='_business_invoice_number_uc'),
+        Index('ix_sales_invoices_business_branch_date', 'business_id', 'branch_id', 'invoice_date'),
     )
 
 class SalesInvoiceItem(Base):
@@ -416,6 +465,8 @@ class Expense(Base):
 
     __table_args__ = (
         UniqueConstraint('business_id', 'expense_number', name='_business_expense_number_uc'),
+        Index('ix_expenses_business_branch_date_category', 'business_id', 'branch_id', 'expense_date', 'category'),
+        Index('ix_expenses_business_date', 'business_id', 'expense_date', 'id'),
     )
 
 class PayFrequency(str, enum.Enum):
@@ -495,6 +546,8 @@ class PayslipDeduction(Base):
 
 LedgerEntry.payslip_id = Column(Integer, ForeignKey("payslips.id"), nullable=True)
 LedgerEntry.payslip = relationship("Payslip", back_populates="ledger_entries")
+# The employee ledger looks entries up by their payslips.
+Index('ix_ledger_entries_payslip_date', LedgerEntry.payslip_id, LedgerEntry.transaction_date, LedgerEntry.id)
 
 class Budget(Base):
     __tablename__ = "budgets"
@@ -609,5 +662,19 @@ class BankAccount(Base):
 
     __table_args__ = (
         UniqueConstraint('branch_id', 'account_name', name='_branch_bank_account_name_uc'),
+        # Lets the payment-account lookup find a branch's chart accounts from the index alone.
+        Index('ix_bank_accounts_branch_chart_account', 'branch_id', 'chart_of_account_id'),
     )
 
+
+
+class DocumentCounter(Base):
+    __tablename__ = "document_counters"
+    id = Column(Integer, primary_key=True)
+    business_id = Column(Integer, ForeignKey("businesses.id"), nullable=False)
+    prefix = Column(String, nullable=False)
+    last_number = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint('business_id', 'prefix', name='_business_document_prefix_uc'),
+    )
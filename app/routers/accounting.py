@@ -89,7 +89,8 @@ async def get_general_ledger_page(
         branch_id=current_user.selected_branch.id,
         start_date=start_date, 
         end_date=end_date, 
-        account_id=account_id
+        account_id=account_id,
+        stream=True # The template renders the rows in one pass before the session closes
     )
     accounts = crud.get_chart_of_accounts(db, business_id=current_user.business_id)
     user_perms = crud.get_user_permissions(current_user, db)
@@ -1,8 +1,8 @@
 # Create new file: app/routers/analytics.py
 
-from fastapi import APIRouter, Depends, Request, Form
+from fastapi import APIRouter, Depends, Request, Form, HTTPException
 from fastapi.responses import HTMLResponse
-from .. import crud, models, security
+from .. import crud, models, schemas, security
 from ..database import get_db
 from ..templating import templates
 from fastapi import Query
@@ -190,8 +190,8 @@ async def handle_update_forecast(
     and returns just the updated chart data.
     """
     try:
-        scenarios = json.loads(scenarios_json)
-    except json.JSONDecodeError:
+        scenarios = [schemas.CashFlowScenario(**scenario) for scenario in json.loads(scenarios_json)]
+    except (ValueError, TypeError):
         raise HTTPException(status_code=400, detail="Invalid scenario format.")
 
     updated_forecast_data = analytics_crud.get_cash_flow_forecast(
@@ -66,19 +66,28 @@ async def handle_create_bank_account(
         "account": new_account
     })
 
+TRANSFERS_PAGE_SIZE = 50
+
 @router.get("/transfers", response_class=HTMLResponse)
 async def get_transfers_page(
     request: Request,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(security.get_current_active_user)
+    current_user: models.User = Depends(security.get_current_active_user),
+    after_date: Optional[date] = None,
+    after_id: Optional[int] = None
 ):
     """Renders the page to manage and create fund transfers."""
     transfer_accounts = crud.banking.get_payment_accounts(db, business_id=current_user.business_id, branch_id=current_user.selected_branch.id)
     transfers = crud.banking.get_fund_transfers_by_branch(
         db, 
         business_id=current_user.business_id, 
-        branch_id=current_user.selected_branch.id
+        branch_id=current_user.selected_branch.id,
+        after=(after_date, after_id) if after_date and after_id else None,
+        limit=TRANSFERS_PAGE_SIZE
     )
+    older_page_url = None
+    if len(transfers) == TRANSFERS_PAGE_SIZE:
+        older_page_url = f"/banking/transfers?after_date={transfers[-1].transfer_date}&after_id={transfers[-1].id}"
     user_perms = crud.get_user_permissions(current_user, db)
 
     return templates.TemplateResponse("banking/transfers.html", {
@@ -87,6 +96,7 @@ async def get_transfers_page(
         "user_perms": user_perms,
         "transfer_accounts": transfer_accounts,
         "transfers": transfers,
+        "older_page_url": older_page_url,
         "title": "Banking & Fund Transfers"
     })
 
@@ -301,17 +311,17 @@ async def export_bank_ledger_excel(
     account = crud.get_account_by_id(db, account_id=account_id, business_id=current_user.business_id)
     if not account: raise HTTPException(404)
 
-    ledger, _, _ = crud.get_account_ledger(db, account_id, current_user.selected_branch.id, start_date, end_date)
+    rows, _, _ = crud.get_account_ledger_rows(db, account_id, current_user.selected_branch.id, start_date, end_date)
 
     headers = ["Date", "Description", "Debit", "Credit", "Balance"]
     data_to_export = [
         [
-            item["entry"].transaction_date.strftime('%Y-%m-%d'),
-            item["entry"].description,
-            item["entry"].debit,
-            item["entry"].credit,
-            item["balance"]
-        ] for item in ledger
+            row.transaction_date.strftime('%Y-%m-%d'),
+            row.description,
+            row.debit,
+            row.credit,
+            row.balance
+        ] for row in rows
     ]
     
     excel_buffer = crud.export_to_excel(headers, data_to_export, f"Statement for {account.name}")
@@ -339,7 +349,9 @@ async def export_bank_ledger_pdf(
 
     # We will handle the date validation in Part 2
     
-    ledger, opening_balance, closing_balance = crud.ledger.get_account_ledger(db, account_id, current_user.selected_branch.id, start_date, end_date)
+    rows, opening_balance, closing_balance = crud.ledger.get_account_ledger_rows(db, account_id, current_user.selected_branch.id, start_date, end_date)
+    # The statement template reads each line's columns from `entry`; the plain rows carry them all
+    ledger = [{"entry": row, "balance": row.balance} for row in rows]
 
     # THE FIX: The generic template expects 'target'. We also need to adapt the account object
     # to have a 'name' attribute for the template to use.
@@ -119,7 +119,7 @@ async def get_budget_report_page(
     current_user: models.User = Depends(security.get_current_active_user)
 ):
     """Generates and displays the Budget vs. Actuals report."""
-    budget = crud.budget.get_budget_by_id(db, budget_id=budget_id, branch_id=current_user.selected_branch.id)
+    budget = crud.budget.get_budget_by_id(db, budget_id=budget_id, branch_id=current_user.selected_branch.id, raise_on_lazy_load=True)
     if not budget:
         raise HTTPException(status_code=404, detail="Budget not found for this branch.")
 
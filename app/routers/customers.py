@@ -6,16 +6,23 @@ from .. import crud, models, schemas, security
 from ..database import get_db
 from ..templating import templates 
 from fastapi.encoders import jsonable_encoder
+from typing import Optional
+from urllib.parse import urlencode
 router = APIRouter(
     prefix="/crm/customers",
     tags=["CRM"],
     dependencies=[Depends(security.get_current_active_user), Depends(security.PermissionChecker(["customers:view"]))]
 )
+
+CUSTOMERS_PAGE_SIZE = 100
+
 @router.get("/", response_class=HTMLResponse)
 async def get_customers_page(
     request: Request,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(security.get_current_active_user)
+    current_user: models.User = Depends(security.get_current_active_user),
+    after_name: Optional[str] = None,
+    after_id: Optional[int] = None
 ):
     # The logic is now much simpler. The selected branch is already on the user object.
     selected_branch = current_user.selected_branch
@@ -23,8 +30,13 @@ async def get_customers_page(
     customers = crud.get_customers_by_branch(
         db, 
         branch_id=selected_branch.id, 
-        business_id=current_user.business_id
+        business_id=current_user.business_id,
+        after=(after_name, after_id) if after_name is not None and after_id else None,
+        limit=CUSTOMERS_PAGE_SIZE
     )
+    next_page_url = None
+    if len(customers) == CUSTOMERS_PAGE_SIZE:
+        next_page_url = "/crm/customers/?" + urlencode({"after_name": customers[-1].name, "after_id": customers[-1].id})
     
     user_perms = crud.get_user_permissions(current_user, db)
 
@@ -34,6 +46,7 @@ async def get_customers_page(
             "request": request,
             "user": current_user,
             "customers": customers,
+            "next_page_url": next_page_url,
             "user_perms": user_perms,
             # Pass the selected branch to the template for display
             "selected_branch": selected_branch, 
@@ -4,6 +4,7 @@ from starlette.status import HTTP_303_SEE_OTHER
 from sqlalchemy.orm import Session
 from typing import Optional
 from datetime import date
+from urllib.parse import urlencode
 from fastapi.encoders import jsonable_encoder
 from fastapi.responses import HTMLResponse, Response
 from .. import crud, models, security
@@ -49,20 +50,35 @@ async def get_new_expense_page(
         "title": "Record New Expense"
     })
 
+EXPENSES_PAGE_SIZE = 100
+
 @router.get("/history", response_class=HTMLResponse, dependencies=[Depends(security.PermissionChecker(["expenses:view"]))])
 async def get_expense_history_page(
     request: Request,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(security.get_current_active_user)
+    current_user: models.User = Depends(security.get_current_active_user),
+    after_date: Optional[date] = None,
+    after_id: Optional[int] = None,
+    q: Optional[str] = None
 ):
-    """Renders the searchable history of all expenses for the selected branch."""
+    """Renders the searchable history of expenses for the selected branch, one page at a time."""
+    search = q.strip() if q else ""
     
     # THE FIX: Call the new branch-specific function
     expenses_objects = crud.get_expenses_by_branch(
         db, 
         business_id=current_user.business_id,
-        branch_id=current_user.selected_branch.id 
+        branch_id=current_user.selected_branch.id,
+        after=(after_date, after_id) if after_date and after_id else None,
+        limit=EXPENSES_PAGE_SIZE,
+        search=search or None
     )
+    older_page_url = None
+    if len(expenses_objects) == EXPENSES_PAGE_SIZE:
+        older_page_params = {"after_date": expenses_objects[-1].expense_date, "after_id": expenses_objects[-1].id}
+        if search:
+            older_page_params["q"] = search
+        older_page_url = f"/expenses/history?{urlencode(older_page_params)}"
     expenses_data_json = jsonable_encoder(expenses_objects)
 
     return templates.TemplateResponse("expenses/expense_history.html", {
@@ -70,6 +86,8 @@ async def get_expense_history_page(
         "user": current_user,
         "user_perms": crud.get_user_permissions(current_user, db),
         "expenses_data": expenses_data_json,
+        "older_page_url": older_page_url,
+        "search": search,
         "title": "Expense History"
     })
 
@@ -139,4 +157,4 @@ async def handle_delete_expense(
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Failed to delete expense: {e}")
-    return Response(status_code=200)
\ No newline at end of file
+    return Response(status_code=200)
\ No newline at end of file
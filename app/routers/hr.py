@@ -229,17 +229,11 @@ async def handle_run_payroll(
 
     try:
         with db.begin_nested():
-            for emp_data in employees_to_pay:
-                # Security check: ensure the employee belongs to the active branch
-                employee = crud.employee.get_employee_by_id(db, emp_data['employee_id'], current_user.business_id)
-                if not employee or employee.branch_id != current_user.selected_branch.id:
-                    raise ValueError(f"Attempted to run payroll for an employee not in the active branch.")
-
-                crud.employee.process_payroll_for_employee(
-                    db=db, employee_id=emp_data['employee_id'], business_id=current_user.business_id,
-                    pay_period_start=pay_period_start, pay_period_end=pay_period_end,
-                    additions=emp_data.get('additions', []), deductions=emp_data.get('deductions', [])
-                )
+            crud.employee.process_payroll_batch(
+                db=db, business_id=current_user.business_id, branch_id=current_user.selected_branch.id,
+                pay_period_start=pay_period_start, pay_period_end=pay_period_end,
+                payroll_items=employees_to_pay
+            )
         db.commit()
     except ValueError as e:
         db.rollback()
@@ -250,19 +244,30 @@ async def handle_run_payroll(
 
     return RedirectResponse(url="/hr/payslips", status_code=HTTP_303_SEE_OTHER)
 
+PAYSLIPS_PAGE_SIZE = 50
+
 @router.get("/payslips", response_class=HTMLResponse, dependencies=[Depends(security.PermissionChecker(["hr:view"]))])
 async def get_payslip_history_page(
     request: Request,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(security.get_current_active_user)
+    current_user: models.User = Depends(security.get_current_active_user),
+    after_date: Optional[date] = None,
+    after_id: Optional[int] = None
 ):
-    payslips = crud.employee.get_payslips_by_business(db, business_id=current_user.business_id)
+    after = (after_date, after_id) if after_date and after_id else None
+    payslips = crud.employee.get_payslips_by_business(
+        db, business_id=current_user.business_id, after=after, limit=PAYSLIPS_PAGE_SIZE
+    )
+    older_page_url = None
+    if len(payslips) == PAYSLIPS_PAGE_SIZE:
+        older_page_url = f"/hr/payslips?after_date={payslips[-1].pay_date}&after_id={payslips[-1].id}"
     user_perms = crud.get_user_permissions(current_user, db)
     return templates.TemplateResponse("hr/payslip_history.html", {
         "request": request,
         "user": current_user,
         "user_perms": user_perms,
         "payslips": payslips,
+        "older_page_url": older_page_url,
         "title": "Payslip History"
     })
 
@@ -24,6 +24,7 @@ async def get_categories_page(request: Request, db: Session = Depends(get_db), c
 async def handle_create_category(request: Request, db: Session = Depends(get_db), current_user: models.User = Depends(security.get_current_active_user), name: str = Form(...), description: str = Form("")):
     category_schema = schemas.CategoryCreate(name=name, description=description)
     new_category = crud.create_category(db, category=category_schema,branch_id=current_user.selected_branch.id,business_id=current_user.business_id)
+    db.commit()
     user_perms = crud.get_user_permissions(current_user, db)
     return templates.TemplateResponse("inventory/partials/category_row.html", {"request": request, "category": new_category, "user_perms": user_perms})
 
@@ -46,6 +47,7 @@ async def handle_update_category(category_id: int, request: Request, db: Session
     if not category: raise HTTPException(status_code=404)
     category_update = schemas.CategoryUpdate(name=name, description=description)
     updated_category = crud.update_category(db, category_id=category_id, category_update=category_update)
+    db.commit()
     user_perms = crud.get_user_permissions(current_user, db)
     return templates.TemplateResponse("inventory/partials/category_row.html", {"request": request, "category": updated_category, "user_perms": user_perms})
 
@@ -55,6 +57,7 @@ async def handle_delete_category(category_id: int, db: Session = Depends(get_db)
     if not category: raise HTTPException(status_code=404)
     if category.products: raise HTTPException(status_code=400, detail="Cannot delete category with associated products.")
     crud.delete_category(db, category_id=category_id)
+    db.commit()
     return HTMLResponse(content="", status_code=200)
 
 # === Products Routes (Now Branch-Aware) ===
@@ -80,7 +83,8 @@ async def handle_create_product(request: Request, db: Session = Depends(get_db),
     # Create product in the currently selected branch
     branch_id = current_user.selected_branch.id
     product_schema = schemas.ProductCreate(name=name, sku=sku, purchase_price=purchase_price, sales_price=sales_price, opening_stock=opening_stock, category_id=category_id, unit=unit)
-    new_product = crud.create_product(db, product=product_schema, branch_id=branch_id)
+    new_product = crud.create_product(db, product=product_schema, branch_id=branch_id, business_id=current_user.business_id)
+    db.commit()
     user_perms = crud.get_user_permissions(current_user, db)
     return templates.TemplateResponse("inventory/partials/product_row.html", {"request": request, "product": new_product, "user_perms": user_perms})
 
@@ -90,6 +94,7 @@ async def handle_delete_product(product_id: int, db: Session = Depends(get_db),
     product = crud.get_product(db, product_id=product_id, branch_id=current_user.selected_branch.id)
     if not product: raise HTTPException(status_code=404, detail="Product not found in this branch.")
     crud.delete_product(db, product_id=product_id)
+    db.commit()
     return HTMLResponse(content="", status_code=200)
 
 @router.get("/products/{product_id}/edit", response_class=HTMLResponse, dependencies=[Depends(security.PermissionChecker(["inventory:edit"]))])
@@ -105,6 +110,7 @@ async def handle_update_product(product_id: int, request: Request, db: Session =
     if not product: raise HTTPException(status_code=404, detail="Product not found in this branch.")
     product_update = schemas.ProductUpdate(name=name, sku=sku, purchase_price=purchase_price, sales_price=sales_price, category_id=category_id, unit=unit)
     updated_product = crud.update_product(db, product_id=product_id, product_update=product_update)
+    db.commit()
     user_perms = crud.get_user_permissions(current_user, db)
     return templates.TemplateResponse("inventory/partials/product_row.html", {"request": request, "product": updated_product, "user_perms": user_perms})
 
@@ -117,19 +123,26 @@ async def get_product_row(product_id: int, request: Request, db: Session = Depen
 
 # --- Stock Adjustment Routes (Now Branch-Aware) ---
 
+ADJUSTMENTS_PAGE_SIZE = 100
+
 @router.get("/adjustments", response_class=HTMLResponse, dependencies=[Depends(security.PermissionChecker(["inventory:view"]))])
 async def get_stock_adjustments_page(
     request: Request,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(security.get_current_active_user)
+    current_user: models.User = Depends(security.get_current_active_user),
+    after_id: Optional[int] = None
 ):
-    adjustments = crud.get_stock_adjustments_by_business(db, business_id=current_user.business_id)
+    adjustments = crud.get_stock_adjustments_by_business(db, business_id=current_user.business_id, after_id=after_id, limit=ADJUSTMENTS_PAGE_SIZE)
+    older_page_url = None
+    if len(adjustments) == ADJUSTMENTS_PAGE_SIZE:
+        older_page_url = f"/inventory/adjustments?after_id={adjustments[-1].id}"
     user_perms = crud.get_user_permissions(current_user, db)
     return templates.TemplateResponse("inventory/stock_adjustments.html", {
         "request": request,
         "user": current_user,
         "user_perms": user_perms,
         "adjustments": adjustments,
+        "older_page_url": older_page_url,
         "title": "Stock Adjustment History"
     })
 
@@ -148,7 +161,12 @@ async def handle_stock_adjustment(
         raise HTTPException(status_code=404, detail="Product not found in the active branch.")
 
     adjustment_schema = schemas.StockAdjustmentCreate(quantity_change=quantity_change, reason=reason)
-    updated_product = crud.create_stock_adjustment(db, adjustment=adjustment_schema, product_id=product_id, user_id=current_user.id)
+    try:
+        updated_product = crud.create_stock_adjustment(db, adjustment=adjustment_schema, product_id=product_id, user_id=current_user.id)
+        db.commit()
+    except Exception:
+        db.rollback()
+        updated_product = None
     
     if not updated_product:
         raise HTTPException(status_code=500, detail="Failed to save stock adjustment.")
@@ -2,11 +2,12 @@
 
 from fastapi import APIRouter, Depends, Request, Form, HTTPException
 from fastapi.responses import HTMLResponse, RedirectResponse
-from sqlalchemy.orm import Session, joinedload 
+from sqlalchemy.orm import Session, selectinload
 from .. import crud, models, security
 from ..database import get_db
 from ..templating import templates
 from datetime import date
+from typing import Optional
 import json
 from starlette.status import HTTP_303_SEE_OTHER
 
@@ -16,23 +17,33 @@ router = APIRouter(
     dependencies=[Depends(security.get_current_active_user), Depends(security.PermissionChecker(["accounting:create"]))]
 )
 
+VOUCHERS_PAGE_SIZE = 50
+
 @router.get("/history", response_class=HTMLResponse)
 async def get_journal_history_page(
     request: Request,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(security.get_current_active_user)
+    current_user: models.User = Depends(security.get_current_active_user),
+    after_date: Optional[date] = None,
+    after_id: Optional[int] = None
 ):
-    """Renders the history of all manual journal entries for the selected branch."""
+    """Renders the history of manual journal entries for the selected branch, one page at a time."""
     vouchers = crud.journal.get_journal_vouchers_by_branch(
         db, 
         business_id=current_user.business_id, 
-        branch_id=current_user.selected_branch.id
+        branch_id=current_user.selected_branch.id,
+        after=(after_date, after_id) if after_date and after_id else None,
+        limit=VOUCHERS_PAGE_SIZE
     )
+    older_page_url = None
+    if len(vouchers) == VOUCHERS_PAGE_SIZE:
+        older_page_url = f"/accounting/journal/history?after_date={vouchers[-1].transaction_date}&after_id={vouchers[-1].id}"
     return templates.TemplateResponse("accounting/journal/history.html", {
         "request": request,
         "user": current_user,
         "user_perms": crud.get_user_permissions(current_user, db),
         "vouchers": vouchers,
+        "older_page_url": older_page_url,
         "title": "Journal Entry History"
     })
 
@@ -137,7 +148,7 @@ async def get_journal_voucher_detail(
     current_user: models.User = Depends(security.get_current_active_user)
 ):
     voucher = db.query(models.JournalVoucher).options(
-        joinedload(models.JournalVoucher.ledger_entries).joinedload(models.LedgerEntry.account)
+        selectinload(models.JournalVoucher.ledger_entries).joinedload(models.LedgerEntry.account)
     ).filter(
         models.JournalVoucher.id == voucher_id,
         models.JournalVoucher.business_id == current_user.business_id
@@ -163,7 +174,7 @@ async def get_journal_voucher_detail(
 ):
     # Eagerly load the ledger entries and the account related to each entry
     voucher = db.query(models.JournalVoucher).options(
-        joinedload(models.JournalVoucher.ledger_entries).joinedload(models.LedgerEntry.account)
+        selectinload(models.JournalVoucher.ledger_entries).joinedload(models.LedgerEntry.account)
     ).filter(
         models.JournalVoucher.id == voucher_id,
         models.JournalVoucher.business_id == current_user.business_id
@@ -121,6 +121,8 @@ async def handle_import_data(
     branch_id = current_user.selected_branch.id
     business_id = current_user.business_id
 
+    product_schemas = []
+
     try:
         with db.begin_nested(): # Use a transaction
             for record in records:
@@ -139,16 +141,17 @@ async def handle_import_data(
                         crud.create_vendor(db, vendor=vendor_schema)
 
                     elif data_type == "products":
-                        # Products are created per branch, business is inferred
+                        # Products are validated here and inserted together after the loop
                         record['branch_id'] = branch_id
-                        product_schema = schemas.ProductCreate(**record)
-                        crud.create_product(db, product=product_schema, branch_id=branch_id)
+                        product_schemas.append(schemas.ProductCreate(**record))
                     
                     imported_count += 1
                 except Exception as e:
                     # This allows us to skip bad records and continue importing good ones
                     print(f"Skipping record due to error: {record} - Error: {e}")
                     error_count += 1
+            if product_schemas:
+                crud.create_products_bulk(db, products=product_schemas, branch_id=branch_id, business_id=business_id)
         db.commit()
     except Exception as e:
         db.rollback()
@@ -176,7 +179,7 @@ async def get_opening_balances_page(
     chart_of_accounts = crud.get_chart_of_accounts(db, business_id=current_user.business_id)
     
     # IMPORTANT: Use jsonable_encoder to prevent serialization errors in the template
-    accounts_json = jsonable_encoder(chart_of_accounts)
+    accounts_json = jsonable_encoder([account._asdict() for account in chart_of_accounts])
     
     user_perms = crud.get_user_permissions(current_user, db=request.state.db)
     return templates.TemplateResponse("onboarding/opening_balances.html", {
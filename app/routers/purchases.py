@@ -14,6 +14,7 @@ import json
 from datetime import datetime, date
 from fastapi.encoders import jsonable_encoder 
 from typing import List, Optional
+from urllib.parse import urlencode
 from .. import crud
 router = APIRouter(
     prefix="/purchases",
@@ -106,16 +107,35 @@ async def get_debit_notes_history_page(
     })
 
 
+PURCHASE_BILLS_PAGE_SIZE = 100
+
 @router.get("/history", response_class=HTMLResponse, dependencies=[Depends(security.PermissionChecker(["purchases:view"]))])
 async def get_purchase_history_page(
     request: Request,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(security.get_current_active_user)
+    current_user: models.User = Depends(security.get_current_active_user),
+    after_date: Optional[date] = None,
+    after_id: Optional[int] = None,
+    q: Optional[str] = None
 ):
     # For admins, show all bills. For others, it's implicitly filtered by their branch access.
     # We can add a filter dropdown on the frontend later if needed.
     active_branch = current_user.selected_branch
-    bills_objects = crud.get_purchase_bills_by_business(db, business_id=current_user.business_id, branch_id=active_branch.id)
+    search = q.strip() if q else ""
+    bills_objects = crud.get_purchase_bills_by_business(
+        db,
+        business_id=current_user.business_id,
+        branch_id=active_branch.id,
+        after=(after_date, after_id) if after_date and after_id else None,
+        limit=PURCHASE_BILLS_PAGE_SIZE,
+        search=search or None
+    )
+    older_page_url = None
+    if len(bills_objects) == PURCHASE_BILLS_PAGE_SIZE:
+        older_page_params = {"after_date": bills_objects[-1].bill_date, "after_id": bills_objects[-1].id}
+        if search:
+            older_page_params["q"] = search
+        older_page_url = f"/purchases/history?{urlencode(older_page_params)}"
     
     bills_json = jsonable_encoder(bills_objects)
     
@@ -126,6 +146,8 @@ async def get_purchase_history_page(
         "user": current_user,
         "user_perms": user_perms,
         "bills_data": bills_json,
+        "older_page_url": older_page_url,
+        "search": search,
         "title": "Purchase History"
     })
 
@@ -196,7 +218,7 @@ async def handle_preview_purchase_bill(
             })
             total_amount += line_total
 
-    next_bill_number = crud.get_next_purchase_bill_number(db, business_id=current_user.business_id)
+    next_bill_number = crud.peek_next_purchase_bill_number(db, business_id=current_user.business_id)
     user_perms = crud.get_user_permissions(current_user, db)
 
     return templates.TemplateResponse("purchases/preview_purchase_bill.html", {
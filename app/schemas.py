@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr
-from typing import List, Optional
+from typing import List, Optional, Literal
 from datetime import datetime, date
 from .models import AccountType, PayFrequency
 
@@ -281,3 +281,8 @@ class Payslip(PayslipBase):
     deductions: List[PayslipDeduction] = []
     class Config:
         from_attributes = True
+
+class CashFlowScenario(BaseModel):
+    type: Literal['income', 'expense']
+    amount: float
+    description: Optional[str] = None
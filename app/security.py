@@ -4,7 +4,7 @@ from fastapi import Depends, HTTPException, status, Request, Response
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from datetime import datetime, timedelta, timezone
-from sqlalchemy.orm import Session, subqueryload
+from sqlalchemy.orm import Session
 from typing import List, Set
 from cryptography.fernet import Fernet
 